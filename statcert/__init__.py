@@ -1,6 +1,19 @@
-from .model import Info, Record, Certificate, ProbeInfo
+from .model import (
+    Info,
+    Record,
+    Certificate,
+    CertificateStore,
+    ProbeInfo,
+    ChainInfo,
+)
 from .operation import (
     CheckOCSP,
     CertAiohttp,
+    CertHandshake,
+    CachingResolver,
+)
+from .task_loop import (
+    run_operation,
+    strategy_naive_sequential,
+    strategy_worker_pool,
 )
-from .task_loop import run_operation
@@ -0,0 +1,121 @@
+import base64
+import json
+import os
+from datetime import datetime, timedelta
+
+from .model import Record
+
+
+class Checkpoint:
+    """Append-only log of finished records, used to resume scans.
+
+    Each record is saved as a line of JSON (see `Record.serialize`),
+    along with its results, as soon as it finishes. When resuming, the
+    records already in the file are restored instead of being fetched
+    again; a record left half-written by a crash is discarded.
+
+    A file that already holds records is only written to when resuming
+    from it, or when `overwrite` is set.
+    """
+
+    def __init__(self, file, resume=False, overwrite=False):
+        self.file = file
+        self.resume = resume
+        self.overwrite = overwrite
+        self.done = set()  # record indexes
+        self.fh = None
+        self._restorable = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __contains__(self, index):
+        return index in self.done
+
+    def open(self):
+        exists = os.path.exists(self.file)
+        if self.resume and exists:
+            end = 0
+            for data, end in self._read():
+                self.done.add(data["index"])
+                self._restorable += 1
+
+            self.fh = open(self.file, "r+b")
+            self.fh.truncate(end)
+            self.fh.seek(end)
+        else:
+            if exists and os.path.getsize(self.file) and not self.overwrite:
+                raise FileExistsError(
+                    f"checkpoint {self.file} already holds records; resume"
+                    " from it, or overwrite it explicitly"
+                )
+            self.fh = open(self.file, "wb")
+
+    def close(self):
+        if self.fh:
+            self.fh.close()
+            self.fh = None
+
+    def save(self, rec):
+        line = json.dumps(rec.serialize(), default=_encode) + "\n"
+        self.fh.write(line.encode("utf-8"))
+        self.fh.flush()
+        self.done.add(rec.index)
+
+    def restore(self):
+        """Yield the records found in the file when it was opened."""
+        for count, (data, _) in enumerate(self._read()):
+            if count >= self._restorable:
+                break
+            yield Record.deserialize(data)
+
+    def _read(self):
+        """Yield each complete entry in the file, and the offset at which
+        it ends."""
+        end = 0
+        with open(self.file, "rb") as fh:
+            for line in fh:
+                if not line.endswith(b"\n"):
+                    return
+                try:
+                    data = json.loads(line, object_hook=_decode)
+                except ValueError:
+                    return
+                end += len(line)
+                yield data, end
+
+
+# values JSON has no type for are saved as {tag: encoded value}, so that
+# restored records are written out just like fetched ones
+_TYPES = {
+    "$datetime": (datetime, datetime.isoformat, datetime.fromisoformat),
+    "$timedelta": (
+        timedelta, timedelta.total_seconds,
+        lambda seconds: timedelta(seconds=seconds),
+    ),
+    "$bytes": (
+        bytes,
+        lambda value: base64.b64encode(value).decode("ascii"),
+        base64.b64decode,
+    ),
+}
+
+
+def _encode(value):
+    for tag, (type, encode, _) in _TYPES.items():
+        if isinstance(value, type):
+            return {tag: encode(value)}
+    # e.g. IP addresses of subject alternative names
+    return str(value)
+
+
+def _decode(obj):
+    if len(obj) == 1:
+        [(tag, value)] = obj.items()
+        if tag in _TYPES:
+            return _TYPES[tag][2](value)
+    return obj
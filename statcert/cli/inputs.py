@@ -1,42 +1,53 @@
 import csv
+import itertools
 
 
 def get_domains_from_file(file):
-    content = file.readlines()
+    """Lazily read records from an open file.
+
+    Files can have a single column of domains, two columns (index and
+    domain) or a header with a "domain" column.
+    """
+    lines = iter(file)
+    first_line = next(lines, None)
+    if first_line is None:
+        return iter([])
+    content = itertools.chain([first_line], lines)
+    first_line = first_line.strip().split(",")
+    num_fields = len(first_line)
 
     def record(idx, dom): return {
         "index": int(idx),
         "domain": dom.strip(),
     }
 
-    for line in content:
-        first_line = line.strip().split(",")
-        num_fields = len(first_line)
-        if num_fields > 0:
-            break
-        else:
-            first_line = []
-
     if "domain" in first_line:
-        return [
+        return (
             record(rec.get("index", idx), rec["domain"])
             for idx, rec in enumerate(csv.DictReader(content), start=1)
             if len(rec) > 0
             if rec["domain"].strip() != ""
-        ]
+        )
     elif num_fields == 1:
-        return [
+        return (
             record(idx, *line)
             for idx, line in enumerate(csv.reader(content), start=1)
             if len(line) > 0
             if line[0].strip() != ""
-        ]
+        )
     elif num_fields == 2:
-        return [
+        return (
             record(*line)
             for line in csv.reader(content)
             if len(line) > 0
             if line[1].strip() != ""
-        ]
+        )
     else:
         raise ValueError("unrecognized file structure")
+
+
+def read_domains_file(file_name):
+    """Yield records from `file_name`, keeping it open until the last
+    record is read."""
+    with open(file_name) as file:
+        yield from get_domains_from_file(file)
@@ -1,20 +1,36 @@
 import asyncio
+import itertools
 import random
 import sys
+from contextlib import nullcontext
 
 from tqdm import tqdm
 from tranco import Tranco
 
-from .. import (
-    run_operation,
-    CheckOCSP,
-    CertAiohttp,
-    Record,
-)
+from .. import run_operation, Record
+from ..checkpoint import Checkpoint
+from ..work_queue import WorkQueue
 from .options import parse_options
-from .inputs import get_domains_from_file
-from .summary import create_summary
-from .outputs import write_output, print_record
+from .inputs import read_domains_file
+from .summary import Summary
+from .outputs import (
+    CertificateWriter,
+    IGNORE_FIELDS,
+    open_output,
+    print_record,
+)
+from .runner import (
+    build_limiter,
+    build_metrics,
+    build_operations,
+    build_retry_strategy,
+    build_strategy,
+    run_coordinator,
+    run_sharded,
+    run_worker,
+    set_event_loop_policy,
+    with_metrics,
+)
 
 
 def main(args=None):
@@ -24,96 +40,198 @@ def main(args=None):
 
     log = print if options["log_summary"] else lambda *_: None
 
-    input_list = get_input_list(
+    if options.run_role == "worker":
+        return work(options, log)
+
+    inputs, total = get_inputs(
         arg_list=options["inp_list"],
         inp_type=options["inp_type"],
         range=options["inp_range"],
         rand=options["inp_random"],
         log=log,
     )
-    records = [Record(**inp) for inp in input_list]
 
     log("fetching certificates...")
     if options["log_progress"]:
-        pbar = tqdm(total=len(input_list), unit="cert")
+        pbar = tqdm(total=total, unit="cert")
         log = pbar.write
     else:
         pbar = None
 
-    operations = [CertAiohttp()]
-    if options.inp_ocsp:
-        operations.append(CheckOCSP())
-    results = []
+    summary = Summary()
+    if options.out_certs:
+        certs_output = CertificateWriter(options.out_certs)
+    else:
+        certs_output = None
+    if options.out_file:
+        output = open_output(
+            options.out_file, options.out_format,
+            exclude=IGNORE_FIELDS if certs_output else (),
+        )
+    else:
+        output = None
 
     async def done_cb(res):
-        results.append(res)
+        summary.add(res)
+        for writer in (output, certs_output):
+            if writer is None:
+                continue
+            try:
+                writer.write(res)
+            except Exception as exc:
+                # one unwritable record mustn't abort the whole scan
+                tqdm.write(
+                    f"#{res.index} {res.domain}: not written to"
+                    f" {writer.file}: {exc!r}",
+                    file=sys.stderr,
+                )
         if pbar:
+            pbar.set_postfix(summary.postfix(), refresh=False)
             pbar.update()
         if options["log_results"]:
             is_detailed = options["log_results"] > 1
             print(print_record(res, detailed=is_detailed)+"\n")
 
-    if sys.platform == "win32":
-        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    set_event_loop_policy()
 
-    try:
-        results = asyncio.run(run_operation(
-            operations, records, callback=done_cb)
+    if options.run_checkpoint:
+        checkpoint = Checkpoint(
+            options.run_checkpoint,
+            resume=options.run_resume,
+            overwrite=options.run_overwrite_checkpoint,
         )
-    except KeyboardInterrupt:
-        pass
+    else:
+        checkpoint = None
+
+    if options.run_role == "coordinator":
+        work_queue = WorkQueue(options.run_queue)
+    else:
+        work_queue = None
+
+    # the checkpoint first: it may refuse to start over, before any output
+    # file is truncated
+    with checkpoint or nullcontext(), output or nullcontext(), \
+            certs_output or nullcontext(), work_queue or nullcontext():
+        if checkpoint and checkpoint.done:
+            log(f"resuming after {len(checkpoint.done)} fetched records.")
+        if work_queue:
+            run = run_coordinator(
+                work_queue, inputs,
+                callback=done_cb, checkpoint=checkpoint, stream=True,
+            )
+        elif options.run_workers > 1:
+            run = run_sharded(
+                options, inputs, options.run_workers,
+                callback=done_cb, checkpoint=checkpoint, stream=True,
+            )
+        else:
+            metrics = build_metrics(options)
+            run = run_operation(
+                build_operations(options),
+                (Record(**inp) for inp in inputs),
+                strategy=build_strategy(options),
+                retry_strategy=build_retry_strategy(options),
+                callback=done_cb,
+                limiter=build_limiter(options),
+                checkpoint=checkpoint,
+                metrics=metrics,
+                stream=True,
+            )
+            if metrics:
+                run = with_metrics(run, metrics, options.run_metrics_port)
+        try:
+            asyncio.run(run)
+        except KeyboardInterrupt:
+            pass  # summarize what was fetched so far
 
     if pbar:
         pbar.close()
         log = print
 
-    summary = create_summary([vars(rec) for rec in results])
-    log(f"fetched {summary['https_support']} certificates.\n")
+    log(f"fetched {summary.https_support} certificates.\n")
 
-    print_summary(summary, log, detailed=(options.log_summary > 1))
+    print_summary(summary.as_dict(), log, detailed=(options.log_summary > 1))
 
-    if options["out_file"]:
-        write_output(
-            records=results,
-            file=options["out_file"],
-            format=options["out_format"],
-        )
 
+def work(options, log):
+    """Fetch records from the queue of a coordinator process."""
+    set_event_loop_policy()
+
+    log("waiting for records...")
+    pbar = tqdm(unit="cert") if options.log_progress else None
+    count = 0
 
-def get_input_list(arg_list, inp_type, range=(0, None), rand=False, log=print):
+    async def done_cb(res):
+        nonlocal count
+        count += 1
+        if pbar:
+            pbar.update()
+        if options.log_results:
+            is_detailed = options.log_results > 1
+            print(print_record(res, detailed=is_detailed)+"\n")
+
+    with WorkQueue(options.run_queue) as work_queue:
+        try:
+            metrics = build_metrics(options)
+            run = run_worker(
+                options, work_queue, callback=done_cb, metrics=metrics
+            )
+            if metrics:
+                run = with_metrics(run, metrics, options.run_metrics_port)
+            asyncio.run(run)
+        except KeyboardInterrupt:
+            pass
+
+    if pbar:
+        pbar.close()
+    log(f"fetched {count} records.")
+
+
+def get_inputs(arg_list, inp_type, range=(0, None), rand=False, log=print):
+    """Return an iterator over the input records, and how many there
+    are (None if that can't be known without reading them all).
+
+    Records are read lazily, unless they must be shuffled.
+    """
     log("loading records...")
 
     if inp_type == "tranco":
-        input_list = [
+        domains = Tranco().list().list
+        inputs = (
             {
                 "index": idx,
                 "domain": dom,
             }
-            for idx, dom in enumerate(Tranco().list().list, 1)
-        ]
+            for idx, dom in enumerate(domains, 1)
+        )
+        total = len(domains)
     elif inp_type == "file":
-        with open(arg_list[0]) as file:
-            input_list = get_domains_from_file(file)
+        inputs = read_domains_file(arg_list[0])
+        total = None
     else:
-        input_list = [
+        inputs = (
             {
                 "index": idx,
                 "domain": dom,
             }
             for idx, dom in enumerate(arg_list, start=1)
-        ]
+        )
+        total = len(arg_list)
 
     if rand:
-        random.shuffle(input_list)
+        inputs = list(inputs)
+        random.shuffle(inputs)
+        total = len(inputs)
 
     start, end = range
-    start = start - 1 if start > 0 else start
-    end = end or len(input_list)
-    input_list = input_list[start:end]
-
-    log(f"loaded {len(input_list)} records.\n")
+    inputs = itertools.islice(inputs, start, end)
+    if total is not None:
+        total = max(min(total, end or total) - start, 0)
+        log(f"loaded {total} records.\n")
+    elif end is not None:
+        total = end - start  # upper bound, for the progress bar
 
-    return input_list
+    return inputs, total
 
 
 def print_summary(sums, print_func, ocsp=False, detailed=False):
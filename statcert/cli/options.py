@@ -1,10 +1,17 @@
 import argparse
+import ipaddress
 import os
 import warnings
 from collections.abc import Mapping
 from dataclasses import dataclass
 
 from . import __doc__ as PROG_DESC
+from ..retry import (
+    DEFAULT_BASE_DELAY,
+    DEFAULT_DEFER_AFTER,
+    DEFAULT_RETRY_RATIO,
+)
+from ..task_loop import DEFAULT_MAX_IN_FLIGHT
 
 
 PROG_NAME = "statcert"
@@ -17,8 +24,19 @@ LOG_PRESETS = {  # (progress, summary, results)
     "verbose":  (True, 2, 2),
 }
 
+# seconds
+DEFAULT_TIMEOUT = 2
+DEFAULT_SLOW_TIMEOUT = 60
+
+DEFAULT_SLOW_CONCURRENCY = 10
+
+DEFAULT_KEEPALIVE = 15  # seconds
+
 KNOWN_EXTENSIONS = {
     ".json": "json",
+    ".jsonl": "jsonl",
+    ".parquet": "parquet",
+    ".sqlite": "sqlite",
     ".csv": "csv",
     ".txt": "plain",
 }
@@ -31,12 +49,38 @@ class Options(Mapping):
     inp_range:      tuple   # (start: int = 0, end: int | None = None)
     inp_random:     bool
     inp_ocsp:       bool
+    inp_ocsp_cache: str     # filename
+    inp_ocsp_batch: int     # max certificates per OCSP request
     out_file:       str     # filename
-    out_format:     str     # (json | csv | plain)
+    out_format:     str     # (json | jsonl | csv | parquet | sqlite | plain)
+    out_certs:      str     # filename
     log_progress:   bool
     log_summary:    int     # (none=0 | short=1 | long=2)
     log_results:    int     # (none=0 | short=1 | long=2)
     log_debug:      bool
+    run_concurrency: int    # max records in flight, per worker
+    run_workers:    int     # processes
+    run_probe:      str     # (http | tls)
+    run_rate:       float   # global requests per second (None = unlimited)
+    run_host_rate:  float   # requests per second per host (None = unlimited)
+    run_checkpoint: str     # filename
+    run_resume:     bool
+    run_overwrite_checkpoint: bool
+    run_metrics_port: int   # None = no metrics
+    run_role:       str     # (None | coordinator | worker)
+    run_queue:      str     # filename
+    run_nameservers: list   # IP addresses (None = the system's)
+    run_retry_delay: float  # seconds before the first retry
+    run_retry_budget: float  # retries per record, across the operation
+    run_timeout:    float   # seconds
+    run_slow_timeout: float  # seconds, for retries after a timeout
+    run_two_pass:   bool    # retry timeouts once everything else is done
+    run_slow_concurrency: int  # max retried records in flight, per worker
+    run_connection_limit: int  # per worker (None = run_concurrency)
+    run_host_connection_limit: int  # per worker (None = unlimited)
+    run_keepalive:  float   # seconds (0 = no keep-alive)
+    run_happy_eyeballs: float  # seconds (None = aiohttp's default)
+    run_dns_ttl:    float   # seconds (None = the records' TTL)
 
     def __getitem__(self, key):
         return vars(self)[key]
@@ -55,6 +99,21 @@ def parse_options(raw_args):
     inp_type = args.type or _deduce_arg_type(args.input)
     inp_range = _parse_range(args.range)
     out_format = args.format or _deduce_file_format(args.output)
+    if args.resume and not args.checkpoint:
+        raise ValueError("--resume requires a --checkpoint file")
+    if args.overwrite_checkpoint and not args.checkpoint:
+        raise ValueError(
+            "--overwrite-checkpoint requires a --checkpoint file"
+        )
+    run_role, run_queue = (
+        ("coordinator", args.coordinate) if args.coordinate else
+        ("worker", args.work) if args.work else
+        (None, None)
+    )
+    if run_role and args.workers > 1:
+        raise ValueError(
+            "--workers can't be used with --coordinate or --work"
+        )
 
     default_preset = (
         "file" if args.output else
@@ -76,10 +135,36 @@ def parse_options(raw_args):
         inp_range=inp_range,
         inp_random=args.random,
         inp_ocsp=args.ocsp,
+        inp_ocsp_cache=args.ocsp_cache,
+        inp_ocsp_batch=args.ocsp_batch,
         out_file=args.output,
         out_format=out_format,
+        out_certs=args.certs,
         **log_opts,
         log_debug=args.debug,
+        run_concurrency=args.concurrency,
+        run_workers=args.workers,
+        run_probe=args.probe,
+        run_rate=args.rate,
+        run_host_rate=args.host_rate,
+        run_checkpoint=args.checkpoint,
+        run_resume=args.resume,
+        run_overwrite_checkpoint=args.overwrite_checkpoint,
+        run_metrics_port=args.metrics_port,
+        run_role=run_role,
+        run_queue=run_queue,
+        run_nameservers=args.nameservers,
+        run_retry_delay=args.retry_delay,
+        run_retry_budget=args.retry_budget,
+        run_timeout=args.timeout,
+        run_slow_timeout=args.slow_timeout,
+        run_two_pass=args.two_pass,
+        run_slow_concurrency=args.slow_concurrency,
+        run_connection_limit=args.connection_limit,
+        run_host_connection_limit=args.host_connection_limit,
+        run_keepalive=args.keepalive,
+        run_happy_eyeballs=args.happy_eyeballs,
+        run_dns_ttl=args.dns_ttl,
     )
 
 
@@ -92,6 +177,7 @@ def _create_argument_parser(name, desc):
     _add_log_args(parser)
     _add_input_args(parser)
     _add_output_args(parser)
+    _add_run_args(parser)
 
     return parser
 
@@ -226,6 +312,24 @@ def _add_input_args(parser):
         action="store_true",
         help="also fetch OCSP status",
     )
+    input_opts.add_argument(
+        "--ocsp-cache",
+        action="store",
+        default=None,
+        help="reuse OCSP responses stored in this file while they're"
+        " still valid, and store new ones in it (requires --ocsp)",
+        metavar="FILE",
+    )
+    input_opts.add_argument(
+        "--ocsp-batch",
+        action="store",
+        type=_positive_int,
+        default=1,
+        help="query OCSP status of up to NUM certificates in a"
+        " single request, for responders that support it"
+        " (requires --ocsp)",
+        metavar="NUM",
+    )
     return parser
 
 
@@ -243,10 +347,278 @@ def _add_output_args(parser):
         action="store",
         choices=KNOWN_EXTENSIONS.values(),
         help="format results as plain text ('plain'/.txt),"
-        " Comma-Separated Values ('csv') or using"
-        " Javascript Object Notation ('json') (requires"
-        " --output)",
+        " Comma-Separated Values ('csv'), Javascript Object"
+        " Notation ('json'), JSON Lines ('jsonl'), Parquet"
+        " ('parquet', requires pyarrow) or a SQLite database"
+        " ('sqlite') (requires --output)",
+    )
+    output_opts.add_argument(
+        "--certs",
+        action="store",
+        default=None,
+        help="save each certificate received only once to this file,"
+        " as JSON Lines, instead of along with every domain serving"
+        " it; domains refer to them by their SHA-256 fingerprint",
+        metavar="FILE",
+    )
+
+
+def _add_run_args(parser):
+    run_opts = parser.add_argument_group("Run options")
+    run_opts.add_argument(
+        "-c", "--concurrency",
+        action="store",
+        type=_positive_int,
+        default=DEFAULT_MAX_IN_FLIGHT,
+        help="maximum number of domains fetched at the same"
+        f" time (default is {DEFAULT_MAX_IN_FLIGHT}; 1 fetches"
+        " them one by one)",
+        metavar="NUM",
+    )
+    run_opts.add_argument(
+        "-w", "--workers",
+        action="store",
+        type=_positive_int,
+        default=1,
+        help="split the domains between NUM processes, each"
+        " fetching up to --concurrency of them at the same time;"
+        " rate limits are shared between them (default is 1)",
+        metavar="NUM",
+    )
+    run_opts.add_argument(
+        "--probe",
+        action="store",
+        default="http",
+        choices=["http", "tls"],
+        help="fetch certificates with an HTTP request, following"
+        " redirects ('http', the default), or with a bare TLS"
+        " handshake, which is faster but doesn't follow"
+        " redirects ('tls')",
+    )
+    run_opts.add_argument(
+        "--rate",
+        action="store",
+        type=_positive_float,
+        default=None,
+        help="maximum number of requests per second, across all"
+        " hosts (unlimited by default)",
+        metavar="NUM",
+    )
+    run_opts.add_argument(
+        "--host-rate",
+        action="store",
+        type=_positive_float,
+        default=None,
+        help="maximum number of requests per second sent to a"
+        " single host, such as an OCSP responder or the address"
+        " of a CDN serving many domains (unlimited by default)",
+        metavar="NUM",
+    )
+    run_opts.add_argument(
+        "--checkpoint",
+        action="store",
+        default=None,
+        help="save each fetched record to this file, so that an"
+        " interrupted operation can be resumed with --resume",
+        metavar="FILE",
+    )
+    run_opts.add_argument(
+        "--resume",
+        action="store_true",
+        help="skip the records already saved in the --checkpoint"
+        " file, instead of starting over",
+    )
+    run_opts.add_argument(
+        "--overwrite-checkpoint",
+        action="store_true",
+        help="start over, even if the --checkpoint file already holds"
+        " records (which is refused otherwise)",
+    )
+    run_opts.add_argument(
+        "--metrics-port",
+        action="store",
+        type=_positive_int,
+        default=None,
+        help="serve live metrics of the operation (throughput, domains"
+        " in flight, errors, retries and latencies) in Prometheus'"
+        " format at http://127.0.0.1:PORT/metrics; with --workers,"
+        " each process uses the next port",
+        metavar="PORT",
+    )
+    run_opts.add_argument(
+        "--timeout",
+        action="store",
+        type=_positive_float,
+        default=DEFAULT_TIMEOUT,
+        help="give up on an attempt to fetch a domain after NUM seconds"
+        f" (default is {DEFAULT_TIMEOUT})",
+        metavar="NUM",
+    )
+    run_opts.add_argument(
+        "--slow-timeout",
+        action="store",
+        type=_positive_float,
+        default=DEFAULT_SLOW_TIMEOUT,
+        help="timeout, in seconds, of the attempt following a timeout"
+        f" (default is {DEFAULT_SLOW_TIMEOUT})",
+        metavar="NUM",
+    )
+    run_opts.add_argument(
+        "--two-pass",
+        action="store_true",
+        help="fetch all domains with --timeout first, and only then"
+        " retry those that timed out, with --slow-timeout and"
+        " --slow-concurrency, so slow hosts don't hold up the others",
+    )
+    run_opts.add_argument(
+        "--slow-concurrency",
+        action="store",
+        type=_positive_int,
+        default=DEFAULT_SLOW_CONCURRENCY,
+        help="maximum number of domains retried at the same time in"
+        " the second pass of --two-pass (default is"
+        f" {DEFAULT_SLOW_CONCURRENCY})",
+        metavar="NUM",
+    )
+    run_opts.add_argument(
+        "--retry-delay",
+        action="store",
+        type=_positive_float,
+        default=DEFAULT_BASE_DELAY,
+        help="wait up to NUM seconds before retrying a domain, doubling"
+        " for each further retry; retries that would wait longer than"
+        f" {DEFAULT_DEFER_AFTER} seconds are left for the end of the"
+        f" operation (default is {DEFAULT_BASE_DELAY})",
+        metavar="NUM",
+    )
+    run_opts.add_argument(
+        "--retry-budget",
+        action="store",
+        type=_positive_float,
+        default=DEFAULT_RETRY_RATIO,
+        help="retry at most NUM times as many domains as were fetched,"
+        " so that widespread failures aren't retried over and over"
+        f" (default is {DEFAULT_RETRY_RATIO})",
+        metavar="NUM",
+    )
+    run_opts.add_argument(
+        "--connection-limit",
+        action="store",
+        type=_positive_int,
+        default=None,
+        help="maximum number of connections open at the same time, per"
+        " operation and worker (default is --concurrency)",
+        metavar="NUM",
+    )
+    run_opts.add_argument(
+        "--host-connection-limit",
+        action="store",
+        type=_positive_int,
+        default=None,
+        help="maximum number of connections open to a single host at"
+        " the same time, such as an OCSP responder (unlimited by"
+        " default)",
+        metavar="NUM",
+    )
+    run_opts.add_argument(
+        "--keepalive",
+        action="store",
+        type=_non_negative_float,
+        default=DEFAULT_KEEPALIVE,
+        help="keep idle connections open for reuse for NUM seconds; 0"
+        f" closes them after each request (default is {DEFAULT_KEEPALIVE})",
+        metavar="NUM",
     )
+    run_opts.add_argument(
+        "--happy-eyeballs",
+        action="store",
+        type=_positive_float,
+        default=None,
+        help="when a host has several addresses, try the next one if"
+        " connecting takes more than NUM seconds, without giving up on"
+        " the previous one (requires aiohttp 3.10 or newer)",
+        metavar="NUM",
+    )
+    run_opts.add_argument(
+        "--dns-ttl",
+        action="store",
+        type=_positive_float,
+        default=None,
+        help="keep resolved addresses for at most NUM seconds (by"
+        " default, for the TTL of their DNS records); without aiodns,"
+        " which gives no TTLs, for NUM seconds (60 by default)",
+        metavar="NUM",
+    )
+    run_opts.add_argument(
+        "--nameservers",
+        action="store",
+        type=_address_list,
+        default=None,
+        help="resolve domains by asking these DNS servers, separated"
+        " by commas, instead of the system's (requires aiodns)",
+        metavar="IP[,IP...]",
+    )
+    roles = run_opts.add_mutually_exclusive_group()
+    roles.add_argument(
+        "--coordinate",
+        action="store",
+        default=None,
+        help="split the domains into chunks stored in this queue"
+        " file, to be fetched by other statcert processes started"
+        " with --work, and collect their results",
+        metavar="FILE",
+    )
+    roles.add_argument(
+        "--work",
+        action="store",
+        default=None,
+        help="fetch chunks of domains from the queue file of a"
+        " --coordinate process, until all of them are done;"
+        " input, output and checkpoint options are ignored",
+        metavar="FILE",
+    )
+    return parser
+
+
+def _positive_float(raw_num):
+    num = float(raw_num.replace("_", ""))
+    if num <= 0:
+        raise argparse.ArgumentTypeError(
+            f"must be a positive number: {raw_num}"
+        )
+    return num
+
+
+def _non_negative_float(raw_num):
+    num = float(raw_num.replace("_", ""))
+    if num < 0:
+        raise argparse.ArgumentTypeError(
+            f"must not be a negative number: {raw_num}"
+        )
+    return num
+
+
+def _positive_int(raw_num):
+    num = int(raw_num.replace("_", ""))
+    if num < 1:
+        raise argparse.ArgumentTypeError(
+            f"must be a positive number: {raw_num}"
+        )
+    return num
+
+
+def _address_list(raw_list):
+    addresses = [addr.strip() for addr in raw_list.split(",") if addr.strip()]
+    for addr in addresses:
+        try:
+            ipaddress.ip_address(addr)
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                f"not an IP address: {addr}"
+            ) from None
+    if not addresses:
+        raise argparse.ArgumentTypeError("no addresses given")
+    return addresses
 
 
 def _deduce_arg_type(input_list):
@@ -1,28 +1,72 @@
+import base64
 import csv
+import ipaddress
 import json
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timedelta
+
+from cryptography import x509
+
+from ..model import Certificate
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional, only needed for Parquet output
+    pyarrow = None
 
 
 FIELDS = [
     "index",
     "domain",
-    "status",
-    "site",
-    "redirected",
-    "serial_number",
-    "subject_name",
-    "issuer_name",
-    "not_before",
-    "not_after",
-    "key_alg",
-    "key_length",
-    "sans",
-    "policy_type",
+    "probe_status",
+    "probe_home_page",
+    "probe_redirected",
+    "probe_attempts",
+    "probe_errors",
+    "probe_reason",
+    "cert_serial_number",
+    "cert_fingerprint",
+    "cert_subject_name",
+    "cert_issuer_name",
+    "cert_subject",
+    "cert_issuer",
+    "cert_not_before",
+    "cert_not_after",
+    "cert_duration",
+    "cert_key_alg",
+    "cert_key_length",
+    "cert_subject_alt_names",
+    "cert_policy_oids",
+    "cert_policy_type",
+    "cert_bytes",
+    "chain_length",
+    "chain_subjects",
+    "chain_fingerprints",
+    "chain_bytes",
     "ocsp_status",
-    "errors",
+    "timing_dns",
+    "timing_connect",
+    "timing_http",
+    "timing_throttle",
+    "timing_total",
+    "timing_redirects",
+    "ocsp_timing_dns",
+    "ocsp_timing_connect",
+    "ocsp_timing_http",
+    "ocsp_timing_issuer",
+    "ocsp_timing_throttle",
+    "ocsp_timing_batch",
+    "ocsp_timing_total",
+    "ocsp_timing_redirects",
 ]
 
 IGNORE_FIELDS = [
     "cert_bytes",
+    "chain_bytes",
 ]
 
 IMPORTANT_FIELDS = [
@@ -46,22 +90,521 @@ PRETTY_NAMES = {
     "ocsp_status": "OCSP Status",
 }
 
-def write_output(records, file, format):
-    data = [vars(rec) for rec in records]
-    with open(file, "w") as fh:
-        if format == "csv":
-            fields = data[0].keys()
-            writer = csv.DictWriter(fh, fields)
-            writer.writeheader()
-            writer.writerows(data)
-        elif format == "json":
-            json.dump(data, fh)
-        elif format == "plain":
-            fh.write(
-                "\n\n".join(
-                    [print_record(rec) for rec in records]
-                )
+
+class OutputWriter(ABC):
+    """Write records to a file as soon as they're fetched.
+
+    The file is flushed every `flush_every` records, or when
+    `flush_interval` seconds have passed since the last flush. Fields in
+    `exclude` are left out.
+    """
+
+    mode = "w"
+    newline = None
+
+    def __init__(self, file, flush_every=100, flush_interval=5, exclude=()):
+        self.file = file
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.exclude = set(exclude)
+        self.fh = None
+        self.count = 0
+        self._unflushed = 0
+        self._last_flush = None
+
+    def __enter__(self):
+        self.fh = open(self.file, self.mode, newline=self.newline)
+        self._last_flush = time.monotonic()
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.finish()
+        self.fh.close()
+
+    def write(self, rec):
+        self.write_record(rec)
+        self.count += 1
+        self._unflushed += 1
+        if (
+            self._unflushed >= self.flush_every
+            or time.monotonic() - self._last_flush >= self.flush_interval
+        ):
+            self.flush()
+
+    def flush(self):
+        self.fh.flush()
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def row(self, rec):
+        data = vars(rec)
+        if self.exclude:
+            data = {k: v for k, v in data.items() if k not in self.exclude}
+        return data
+
+    def start(self):
+        ...
+
+    @abstractmethod
+    def write_record(self, rec):
+        ...
+
+    def finish(self):
+        ...
+
+
+class CSVWriter(OutputWriter):
+    newline = ""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.writer = None
+
+    def write_record(self, rec):
+        data = self.row(rec)
+        if self.writer is None:
+            # columns are fixed by the first record: its own extra
+            # fields (from the input file) plus every known field
+            fields = [
+                k for k in [*data.keys(), *FIELDS]
+                if k not in IGNORE_FIELDS
+            ]
+            self.writer = csv.DictWriter(
+                self.fh, dict.fromkeys(fields), extrasaction="ignore"
+            )
+            self.writer.writeheader()
+        self.writer.writerow(data)
+
+
+class JSONWriter(OutputWriter):
+    def start(self):
+        self.fh.write("[")
+
+    def write_record(self, rec):
+        # serialized first, so a failure doesn't leave half a record
+        data = json.dumps(self.row(rec), default=_json_default)
+        if self.count > 0:
+            self.fh.write(",\n")
+        self.fh.write(data)
+
+    def finish(self):
+        self.fh.write("]\n")
+
+
+class JSONLinesWriter(OutputWriter):
+    def write_record(self, rec):
+        data = json.dumps(self.row(rec), default=_json_default)
+        self.fh.write(data + "\n")
+
+
+class CertificateWriter(OutputWriter):
+    """Write each certificate found in the records only once, as JSON
+    Lines of its fingerprint and DER bytes; records refer to them with
+    their `cert_fingerprint` and `chain_fingerprints` fields."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.written = set()  # fingerprints
+
+    def write_record(self, rec):
+        data = vars(rec)
+        certs = list(zip(
+            data.get("chain_fingerprints") or [],
+            data.get("chain_bytes") or [],
+        ))
+        if data.get("cert_fingerprint"):
+            certs.insert(0, (data["cert_fingerprint"], data["cert_bytes"]))
+
+        for fingerprint, der in certs:
+            if fingerprint in self.written:
+                continue
+            self.written.add(fingerprint)
+            json.dump(
+                {"fingerprint": fingerprint, "bytes": der},
+                self.fh, default=_json_default,
+            )
+            self.fh.write("\n")
+
+
+class PlainWriter(OutputWriter):
+    def write_record(self, rec):
+        if self.count > 0:
+            self.fh.write("\n\n")
+        self.fh.write(print_record(rec))
+
+
+class ParquetWriter(OutputWriter):
+    """Write records to a Parquet file with a typed schema (see
+    `_parquet_types`), in row groups of `row_group_size` records.
+
+    Fields without a known type, such as extra fields from the input
+    file, are stored as strings; so are probe errors, as JSON.
+    """
+
+    mode = "wb"
+
+    def __init__(self, *args, row_group_size=10_000, **kwargs):
+        if pyarrow is None:
+            raise RuntimeError(
+                "Parquet output requires pyarrow; install it with"
+                " `pip install statcert[parquet]`"
+            )
+        super().__init__(*args, **kwargs)
+        self.row_group_size = row_group_size
+        self.schema = None
+        self.writer = None
+        self.rows = []
+
+    def finish(self):
+        self.write_row_group()
+        if self.writer is None:  # no records at all
+            self._open_writer({})
+        self.writer.close()
+
+    def write_record(self, rec):
+        self.rows.append(self.row(rec))
+        if len(self.rows) >= self.row_group_size:
+            self.write_row_group()
+
+    def flush(self):
+        # records are only written as full row groups, until closed
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def write_row_group(self):
+        if not self.rows:
+            return
+        if self.writer is None:
+            self._open_writer(self.rows[0])
+
+        columns = [
+            pyarrow.array(
+                [_parquet_value(row.get(field.name), field.type)
+                 for row in self.rows],
+                type=field.type,
             )
+            for field in self.schema
+        ]
+        self.writer.write_table(
+            pyarrow.Table.from_arrays(columns, schema=self.schema)
+        )
+        self.rows = []
+
+    def _open_writer(self, first_row):
+        # like CSVWriter, columns are fixed by the first record
+        types = _parquet_types()
+        fields = [
+            k for k in [*first_row.keys(), *FIELDS]
+            if k not in self.exclude
+        ]
+        self.schema = pyarrow.schema([
+            (field, types.get(field, pyarrow.string()))
+            for field in dict.fromkeys(fields)
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(self.fh, self.schema)
+
+
+class SQLiteWriter(OutputWriter):
+    """Write records to normalized tables of a SQLite database.
+
+    Each certificate is stored once in `certificates`, by fingerprint,
+    and referenced by `records.cert_fingerprint` and `chains`. Records
+    are committed along with each flush, so the database can be queried
+    while they're still being fetched.
+    """
+
+    SCHEMA = [
+        "CREATE TABLE records ("
+        " record_index INTEGER PRIMARY KEY,"
+        " domain TEXT NOT NULL,"
+        " cert_fingerprint TEXT REFERENCES certificates,"
+        " user_info TEXT"
+        ")",
+        "CREATE TABLE probes ("
+        " record_index INTEGER PRIMARY KEY REFERENCES records,"
+        " status TEXT,"
+        " home_page TEXT,"
+        " redirected INTEGER,"
+        " attempts INTEGER,"
+        " reason TEXT"
+        ")",
+        "CREATE TABLE errors ("
+        " record_index INTEGER NOT NULL REFERENCES records,"
+        " position INTEGER NOT NULL,"
+        " type TEXT,"
+        " message TEXT,"
+        " class TEXT,"
+        " PRIMARY KEY (record_index, position)"
+        ")",
+        "CREATE TABLE certificates ("
+        " fingerprint TEXT PRIMARY KEY,"
+        " serial_number TEXT,"
+        " subject_name TEXT,"
+        " issuer_name TEXT,"
+        " subject TEXT,"
+        " issuer TEXT,"
+        " not_before TEXT,"
+        " not_after TEXT,"
+        " duration REAL,"
+        " key_alg TEXT,"
+        " key_length INTEGER,"
+        " subject_alt_names TEXT,"
+        " policy_oids TEXT,"
+        " policy_type TEXT,"
+        " der BLOB"
+        ")",
+        "CREATE TABLE chains ("
+        " record_index INTEGER NOT NULL REFERENCES records,"
+        " position INTEGER NOT NULL,"
+        " fingerprint TEXT NOT NULL REFERENCES certificates,"
+        " PRIMARY KEY (record_index, position)"
+        ")",
+        "CREATE TABLE ocsp ("
+        " record_index INTEGER PRIMARY KEY REFERENCES records,"
+        " status TEXT"
+        ")",
+        "CREATE TABLE timings ("
+        " record_index INTEGER NOT NULL REFERENCES records,"
+        " operation TEXT NOT NULL,"
+        " phase TEXT NOT NULL,"
+        " value REAL,"  # seconds, or the count of redirects
+        " PRIMARY KEY (record_index, operation, phase)"
+        ")",
+        "CREATE INDEX records_domain ON records (domain)",
+        "CREATE INDEX probes_status ON probes (status)",
+        "CREATE INDEX certificates_issuer ON certificates (issuer_name)",
+        "CREATE INDEX certificates_not_after ON certificates (not_after)",
+        "CREATE INDEX ocsp_status ON ocsp (status)",
+    ]
+
+    CERT_FIELDS = [
+        "serial_number", "subject_name", "issuer_name", "subject",
+        "issuer", "not_before", "not_after", "duration", "key_alg",
+        "key_length", "subject_alt_names", "policy_oids", "policy_type",
+    ]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.db = None
+        self.stored_certs = set()  # fingerprints
+
+    def __enter__(self):
+        if os.path.exists(self.file):
+            os.remove(self.file)
+        self.db = sqlite3.connect(self.file)
+        # readers don't block the writer, or each other
+        self.db.execute("PRAGMA journal_mode=WAL")
+        for statement in self.SCHEMA:
+            self.db.execute(statement)
+        self.db.commit()
+        self._last_flush = time.monotonic()
+        return self
+
+    def __exit__(self, *args):
+        self.db.commit()
+        self.db.close()
+
+    def flush(self):
+        self.db.commit()
+        self._unflushed = 0
+        self._last_flush = time.monotonic()
+
+    def write_record(self, rec):
+        data = vars(rec)
+        idx = data["index"]
+        user_info = {
+            k: v for k, v in data.items()
+            if k not in FIELDS and not k.startswith(_OPERATION_PREFIXES)
+        }
+
+        if data.get("cert_fingerprint"):
+            self._store_cert(data["cert_fingerprint"], data.get("cert_bytes"), {
+                field: data.get(f"cert_{field}")
+                for field in self.CERT_FIELDS
+            })
+        self.db.execute(
+            "INSERT INTO records VALUES (?, ?, ?, ?)",
+            (
+                idx, data["domain"], data.get("cert_fingerprint"),
+                _sql_value(user_info) if user_info else None,
+            ),
+        )
+
+        if "probe_status" in data:
+            self.db.execute(
+                "INSERT INTO probes VALUES (?, ?, ?, ?, ?, ?)",
+                (idx, *(
+                    _sql_value(data.get(f"probe_{field}"))
+                    for field in [
+                        "status", "home_page", "redirected", "attempts",
+                        "reason",
+                    ]
+                )),
+            )
+            self.db.executemany(
+                "INSERT INTO errors VALUES (?, ?, ?, ?, ?)",
+                [
+                    (idx, pos, error.get("type"), error.get("message"),
+                     error.get("class"))
+                    if isinstance(error, dict) else
+                    (idx, pos, str(error), None, None)
+                    for pos, error in enumerate(data.get("probe_errors") or [])
+                ],
+            )
+
+        chain = zip(
+            data.get("chain_fingerprints") or [],
+            data.get("chain_bytes") or [],
+        )
+        for pos, (fingerprint, der) in enumerate(chain):
+            self._store_cert(fingerprint, der)
+            self.db.execute(
+                "INSERT INTO chains VALUES (?, ?, ?)", (idx, pos, fingerprint)
+            )
+
+        if data.get("ocsp_status"):
+            self.db.execute(
+                "INSERT INTO ocsp VALUES (?, ?)", (idx, data["ocsp_status"])
+            )
+
+        for prefix, operation in _TIMED_OPERATIONS.items():
+            self.db.executemany(
+                "INSERT INTO timings VALUES (?, ?, ?, ?)",
+                [
+                    (idx, operation, field[len(prefix)+1:], value)
+                    for field, value in data.items()
+                    if field.startswith(prefix + "_")
+                ],
+            )
+
+    def _store_cert(self, fingerprint, der, fields=None):
+        if fingerprint in self.stored_certs:
+            return
+        self.stored_certs.add(fingerprint)
+
+        if fields is None and der is not None:
+            # intermediates only come with their bytes
+            fields = vars(Certificate(der))
+        fields = fields or {}
+        self.db.execute(
+            "INSERT OR IGNORE INTO certificates VALUES"
+            f" (?, {', '.join('?' * len(self.CERT_FIELDS))}, ?)",
+            (
+                fingerprint,
+                *(_sql_value(fields.get(k)) for k in self.CERT_FIELDS),
+                None if "cert_bytes" in self.exclude else der,
+            ),
+        )
+
+
+WRITERS = {
+    "csv": CSVWriter,
+    "json": JSONWriter,
+    "jsonl": JSONLinesWriter,
+    "parquet": ParquetWriter,
+    "plain": PlainWriter,
+    "sqlite": SQLiteWriter,
+}
+
+# fields from operations, as opposed to user info from the input file
+_OPERATION_PREFIXES = ("probe_", "cert_", "chain_", "ocsp_", "timing_")
+
+# timing operation names, with the name of the operation they time
+_TIMED_OPERATIONS = {"timing": "probe", "ocsp_timing": "ocsp"}
+
+
+def open_output(file, format, **kwargs):
+    return WRITERS[format](file, **kwargs)
+
+
+def write_output(records, file, format):
+    with open_output(file, format) as out:
+        for rec in records:
+            out.write(rec)
+
+
+def _parquet_types():
+    strings = pyarrow.list_(pyarrow.string())
+    names = pyarrow.map_(pyarrow.string(), pyarrow.string())
+    timings = {
+        field: (
+            pyarrow.int32() if field.endswith("_redirects")
+            else pyarrow.float64()
+        )
+        for field in FIELDS if "timing_" in field
+    }
+    return {
+        **timings,
+        "index": pyarrow.int64(),
+        "probe_redirected": pyarrow.bool_(),
+        "probe_attempts": pyarrow.int32(),
+        "cert_subject": names,
+        "cert_issuer": names,
+        "cert_not_before": pyarrow.timestamp("s"),
+        "cert_not_after": pyarrow.timestamp("s"),
+        "cert_duration": pyarrow.duration("s"),
+        "cert_key_length": pyarrow.int32(),
+        "cert_subject_alt_names": strings,
+        "cert_policy_oids": strings,
+        "cert_bytes": pyarrow.binary(),
+        "chain_length": pyarrow.int32(),
+        "chain_subjects": strings,
+        "chain_fingerprints": strings,
+        "chain_bytes": pyarrow.list_(pyarrow.binary()),
+    }
+
+
+def _parquet_value(value, type):
+    if value is None:
+        return None
+    if pyarrow.types.is_string(type) and not isinstance(value, str):
+        if isinstance(value, (list, dict)):
+            return json.dumps(value, default=_json_default)
+        return str(value)
+    if pyarrow.types.is_map(type):
+        return list(value.items())
+    if pyarrow.types.is_list(type):
+        # IP address SANs, for instance, in lists of strings
+        return [_parquet_value(item, type.value_type) for item in value]
+    return value
+
+
+def _sql_value(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=_json_default)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if value is None or isinstance(value, (str, int, float, bytes)):
+        return value
+    return str(value)
+
+
+_IP_TYPES = (
+    ipaddress.IPv4Address, ipaddress.IPv6Address,
+    ipaddress.IPv4Network, ipaddress.IPv6Network,
+)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    if isinstance(value, bytes):
+        return base64.b64encode(value).decode("ascii")
+    if isinstance(value, x509.Name):
+        return value.rfc4514_string()
+    if isinstance(value, x509.ObjectIdentifier):
+        return value.dotted_string
+    if isinstance(value, _IP_TYPES):
+        # general names of IP address SANs and name constraints
+        return str(value)
+    raise TypeError(
+        f"Object of type {type(value).__name__} is not JSON serializable"
+    )
 
 
 def print_record(rec, detailed=False):
@@ -0,0 +1,413 @@
+import asyncio
+import heapq
+import itertools
+import multiprocessing
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+
+from .. import (
+    run_operation,
+    CheckOCSP,
+    CertAiohttp,
+    CertHandshake,
+    CachingResolver,
+    Record,
+    strategy_naive_sequential,
+    strategy_worker_pool,
+)
+from ..metrics import MetricsRegistry, serve_metrics
+from ..operation import ConnectorSettings
+from ..operation.resolver import SHARED_CACHE, default_lookup
+from ..rate_limit import RateLimiter
+from ..retry import RetryBudget, RetryPolicy
+
+
+# records sent to a worker process at a time
+CHUNK_SIZE = 64
+
+
+def build_operations(options):
+    resolver = build_resolver(options)
+    # shared, so the SSL context is only created once
+    connector_settings = build_connector_settings(options)
+    probe_options = {
+        "default_timeout": options.run_timeout,
+        "lenient_timeout": options.run_slow_timeout,
+        "resolver": resolver,
+        "retry_policy": build_retry_policy(options),
+    }
+    if options.run_probe == "tls":
+        operations = [CertHandshake(
+            ssl_context=connector_settings.get_ssl_context(),
+            **probe_options,
+        )]
+    else:
+        operations = [CertAiohttp(
+            connector_settings=connector_settings,
+            **probe_options,
+        )]
+    if options.inp_ocsp:
+        operations.append(CheckOCSP(
+            response_cache_file=options.inp_ocsp_cache,
+            batch_size=options.inp_ocsp_batch,
+            resolver=resolver,
+            connector_settings=connector_settings,
+        ))
+    return operations
+
+
+def build_resolver(options):
+    if options.run_dns_ttl is None:
+        return CachingResolver(default_lookup(options.run_nameservers))
+    # every resolver of the process shares the same cache, which caps the
+    # TTLs given by aiodns; getaddrinfo doesn't give any, so its answers
+    # are kept for exactly that long
+    SHARED_CACHE.max_ttl = options.run_dns_ttl
+    return CachingResolver(
+        default_lookup(options.run_nameservers, ttl=options.run_dns_ttl)
+    )
+
+
+def build_connector_settings(options):
+    return ConnectorSettings(
+        limit=options.run_connection_limit or options.run_concurrency,
+        limit_per_host=options.run_host_connection_limit or 0,
+        keepalive_timeout=options.run_keepalive,
+        happy_eyeballs_delay=options.run_happy_eyeballs,
+    )
+
+
+def build_retry_policy(options):
+    return RetryPolicy(
+        base_delay=options.run_retry_delay,
+        retry_budget=RetryBudget(options.run_retry_budget),
+        # in two passes, timed out domains are only retried, with the
+        # lenient timeout, once all the others are done
+        deferred_errors=["timeout"] if options.run_two_pass else [],
+    )
+
+
+def build_strategy(options):
+    if options.run_concurrency > 1:
+        return strategy_worker_pool(options.run_concurrency)
+    return strategy_naive_sequential
+
+
+def build_retry_strategy(options):
+    """Strategy for the records retried at the end of the operation."""
+    if not options.run_two_pass:
+        return None
+    concurrency = min(options.run_slow_concurrency, options.run_concurrency)
+    if concurrency > 1:
+        return strategy_worker_pool(concurrency)
+    return strategy_naive_sequential
+
+
+def build_limiter(options, shares=1):
+    """Rate limiter for the options' rates, split evenly between
+    `shares` processes."""
+    if not (options.run_rate or options.run_host_rate):
+        return None
+    return RateLimiter(
+        rate=options.run_rate and options.run_rate / shares,
+        host_rate=options.run_host_rate and options.run_host_rate / shares,
+    )
+
+
+def build_metrics(options):
+    return MetricsRegistry() if options.run_metrics_port else None
+
+
+async def with_metrics(coro, metrics, port):
+    """Await `coro` while serving `metrics` on `port`."""
+    runner = await serve_metrics(metrics, port)
+    try:
+        return await coro
+    finally:
+        await runner.cleanup()
+
+
+def set_event_loop_policy():
+    if sys.platform == "win32":
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+
+
+async def run_sharded(options, inputs, workers, callback=None,
+                      checkpoint=None, stream=False):
+    """Like `run_operation`, but split over `workers` processes, each
+    running the operations selected by `options` in its own event loop.
+
+    Input records are dealt in chunks to whichever process asks for more,
+    and results are passed to `callback` in input order, and only to it
+    with `stream`. With metrics enabled, each process serves its own, on
+    consecutive ports.
+    """
+    results = []
+
+    async def done(rec):
+        if not stream:
+            results.append(rec)
+        if callback:
+            await callback(rec)
+
+    if checkpoint:
+        for rec in checkpoint.restore():
+            await done(rec)
+        inputs = (inp for inp in inputs if inp["index"] not in checkpoint)
+
+    ctx = multiprocessing.get_context("spawn")
+    in_queue = ctx.Queue(maxsize=2 * workers)
+    out_queue = ctx.Queue()
+    procs = [
+        ctx.Process(
+            target=_worker_main,
+            args=(options, workers, worker_id, in_queue, out_queue),
+            daemon=True,
+        )
+        for worker_id in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+
+    feeder = _Feeder(inputs, in_queue, workers)
+    feeder.start()
+
+    loop = asyncio.get_running_loop()
+    pending = []  # heap of (position, serialized record)
+    next_pos = 0
+    running = workers
+    try:
+        while running:
+            items = await loop.run_in_executor(None, _drain, out_queue, procs)
+            for item in items:
+                if item is None:
+                    running -= 1
+                else:
+                    heapq.heappush(pending, item)
+
+            while pending and pending[0][0] == next_pos:
+                _, data = heapq.heappop(pending)
+                rec = Record.deserialize(data)
+                if checkpoint:
+                    checkpoint.save(rec)
+                await done(rec)
+                next_pos += 1
+    finally:
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+            proc.join()
+        # nobody is left to read what the feeder didn't send
+        in_queue.cancel_join_thread()
+
+    if feeder.error:
+        raise feeder.error
+    return None if stream else results
+
+
+async def run_coordinator(work_queue, inputs, callback=None, checkpoint=None,
+                          chunk_size=1000, poll_interval=1, stream=False):
+    """Queue `inputs` for workers on other machines, and pass the records
+    they finish to `callback`, in input order; they're also returned,
+    unless streamed.
+
+    If `work_queue` was already filled by a previous run, the records it
+    holds are collected instead.
+    """
+    results = []
+
+    async def done(rec):
+        if not stream:
+            results.append(rec)
+        if callback:
+            await callback(rec)
+
+    if checkpoint:
+        for rec in checkpoint.restore():
+            await done(rec)
+        inputs = (inp for inp in inputs if inp["index"] not in checkpoint)
+
+    if not work_queue.filled:
+        work_queue.fill(inputs, chunk_size)
+
+    last_chunk = 0
+    while True:
+        finished = work_queue.finished()
+        for last_chunk, records in work_queue.results(after=last_chunk):
+            for rec in records:
+                if checkpoint:
+                    if rec.index in checkpoint:
+                        continue
+                    checkpoint.save(rec)
+                await done(rec)
+        if finished:
+            return None if stream else results
+        await asyncio.sleep(poll_interval)
+
+
+async def run_worker(options, work_queue, callback=None, owner=None,
+                     poll_interval=1, metrics=None):
+    """Lease chunks from `work_queue` and run the operations selected by
+    `options` on them, until every chunk is done."""
+    owner = owner or f"{socket.gethostname()}:{os.getpid()}"
+
+    while not work_queue.finished():
+        chunks = {}  # id(record) -> (its _LeasedChunk, position in it)
+        open_chunks = {}  # chunk id -> _LeasedChunk not done yet
+        leased = 0
+
+        def records():
+            nonlocal leased
+            while True:
+                lease = work_queue.lease(owner)
+                if lease is None:
+                    return
+                leased += 1
+                chunk = _LeasedChunk(*lease)
+                open_chunks[chunk.id] = chunk
+                for pos, inp in enumerate(chunk.inputs):
+                    rec = Record(**inp)
+                    chunks[id(rec)] = chunk, pos
+                    yield rec
+
+        async def done_cb(rec):
+            chunk, pos = chunks.pop(id(rec))
+            chunk.records[pos] = rec
+            if len(chunk.records) == len(chunk.inputs):
+                work_queue.complete(chunk.id, [
+                    chunk.records[pos] for pos in range(len(chunk.inputs))
+                ])
+                del open_chunks[chunk.id]
+            # including chunks waiting for records whose retries were
+            # deferred to the end of the run
+            for chunk in open_chunks.values():
+                if time.time() - chunk.renewed > work_queue.lease_time / 2:
+                    work_queue.renew(chunk.id, owner)
+                    chunk.renewed = time.time()
+            if callback:
+                await callback(rec)
+
+        await run_operation(
+            build_operations(options), records(),
+            strategy=build_strategy(options),
+            retry_strategy=build_retry_strategy(options),
+            callback=done_cb,
+            limiter=build_limiter(options),
+            metrics=metrics,
+            stream=True,
+        )
+        if not leased:
+            # wait for the chunks leased by other workers to be done, or
+            # for their leases to expire
+            await asyncio.sleep(poll_interval)
+
+
+class _LeasedChunk:
+    def __init__(self, id, inputs):
+        self.id = id
+        self.inputs = inputs
+        self.records = {}  # position -> record
+        self.renewed = time.time()
+
+
+class _Feeder(threading.Thread):
+    """Reads the input records and queues them, numbered by position,
+    for the worker processes."""
+
+    def __init__(self, inputs, in_queue, workers):
+        super().__init__(daemon=True)
+        self.inputs = inputs
+        self.in_queue = in_queue
+        self.workers = workers
+        self.error = None
+
+    def run(self):
+        try:
+            numbered = enumerate(self.inputs)
+            while True:
+                chunk = list(itertools.islice(numbered, CHUNK_SIZE))
+                if not chunk:
+                    break
+                self.in_queue.put(chunk)
+        except Exception as e:
+            self.error = e
+        finally:
+            for _ in range(self.workers):
+                self.in_queue.put(None)
+
+
+def _drain(out_queue, procs):
+    """Wait for results from the workers and return all that are ready,
+    or raise if a worker died."""
+    while True:
+        try:
+            items = [out_queue.get(timeout=1)]
+            break
+        except queue.Empty:
+            for proc in procs:
+                if proc.exitcode:
+                    raise RuntimeError(
+                        f"worker process exited with code {proc.exitcode}"
+                    )
+
+    while True:
+        try:
+            items.append(out_queue.get_nowait())
+        except queue.Empty:
+            return items
+
+
+def _read_chunks(in_queue, chunks, loop):
+    """Pass the chunks of records from `in_queue` to the `chunks` asyncio
+    queue of `loop`, up to the None that ends them."""
+    while True:
+        chunk = in_queue.get()
+        asyncio.run_coroutine_threadsafe(chunks.put(chunk), loop).result()
+        if chunk is None:
+            break
+
+
+def _worker_main(options, workers, worker_id, in_queue, out_queue):
+    positions = {}  # id(record) -> position in the input
+
+    async def records():
+        # the process's queue is read in a thread, so the event loop
+        # never blocks on it; one chunk is read ahead of the one in use
+        chunks = asyncio.Queue(maxsize=1)
+        threading.Thread(
+            target=_read_chunks,
+            args=(in_queue, chunks, asyncio.get_running_loop()),
+            daemon=True,
+        ).start()
+        while (chunk := await chunks.get()) is not None:
+            for pos, inp in chunk:
+                rec = Record(**inp)
+                positions[id(rec)] = pos
+                yield rec
+
+    async def done_cb(rec):
+        out_queue.put((positions.pop(id(rec)), rec.serialize()))
+
+    metrics = build_metrics(options)
+    run = run_operation(
+        build_operations(options), records(),
+        strategy=build_strategy(options),
+        retry_strategy=build_retry_strategy(options),
+        callback=done_cb,
+        limiter=build_limiter(options, shares=workers),
+        metrics=metrics,
+        stream=True,
+    )
+    if metrics:
+        run = with_metrics(run, metrics, options.run_metrics_port + worker_id)
+
+    set_event_loop_policy()
+    try:
+        asyncio.run(run)
+    except KeyboardInterrupt:
+        return
+    out_queue.put(None)
@@ -2,41 +2,84 @@ from collections import Counter
 import warnings
 
 
-def create_summary(result_list):
-    total = 0
-    conn = 0
-    https = 0
-    no_cert = 0
-    pol_t = Counter()
-    errs = Counter()
-    ocsp = Counter()
+class Summary:
+    """Counts updated as each record is fetched, in constant time."""
 
-    for rec in result_list:
-        total += 1
-
-        if rec["probe_status"] != "unknown":
-            conn += 1
-
-        if rec["probe_status"] == "unknown":
-            errs[rec["probe_reason"]] += 1
-        elif rec["probe_status"] == "missing":
-            no_cert += 1
-        elif rec["probe_status"] == "valid":
-            https += 1
-            pol_t[rec["cert_policy_type"]] += 1
-            if rec.get("ocsp_status"):
-                ocsp[rec["ocsp_status"]] += 1
+    def __init__(self):
+        self.total = 0
+        self.connected = 0
+        self.https_support = 0
+        self.only_http = 0
+        self.policy_types = Counter()
+        self.errors = Counter()
+        self.ocsp = Counter()
+
+    def add(self, rec):
+        """Count a `Record`, without flattening all of its fields."""
+        self.count(
+            status=_field(rec, "probe", "status"),
+            reason=_field(rec, "probe", "reason"),
+            policy_type=_field(rec, "cert", "policy_type"),
+            ocsp_status=_field(rec, "ocsp", "status"),
+        )
+
+    def add_row(self, row):
+        """Count a record from its flattened fields (`vars(rec)`)."""
+        self.count(
+            status=row["probe_status"],
+            reason=row.get("probe_reason"),
+            policy_type=row.get("cert_policy_type"),
+            ocsp_status=row.get("ocsp_status"),
+        )
+
+    def count(self, status, reason=None, policy_type=None, ocsp_status=None):
+        self.total += 1
+
+        if status != "unknown":
+            self.connected += 1
+
+        if status == "unknown":
+            self.errors[reason] += 1
+        elif status == "missing":
+            self.only_http += 1
+        elif status == "valid":
+            self.https_support += 1
+            self.policy_types[policy_type] += 1
+            if ocsp_status:
+                self.ocsp[ocsp_status] += 1
         else:
-            warnings.warn(f"Unknown status {rec['probe_status']}")
-
-    ret = {
-        "total": total,
-        "connected": conn,
-        "https_support": https,
-        "only_http": no_cert,
-        "policy_types": pol_t,
-        "errors": errs,
-    }
-    if sum(ocsp.values()) > 0:
-        ret["ocsp"] = ocsp
-    return ret
+            warnings.warn(f"Unknown status {status}")
+
+    def as_dict(self):
+        ret = {
+            "total": self.total,
+            "connected": self.connected,
+            "https_support": self.https_support,
+            "only_http": self.only_http,
+            "policy_types": self.policy_types,
+            "errors": self.errors,
+        }
+        if sum(self.ocsp.values()) > 0:
+            ret["ocsp"] = self.ocsp
+        return ret
+
+    def postfix(self):
+        """Short stats, for the progress bar."""
+        return {
+            "https": self.https_support,
+            "errors": sum(self.errors.values()),
+        }
+
+
+def create_summary(result_list):
+    summary = Summary()
+    for rec in result_list:
+        summary.add_row(rec)
+    return summary.as_dict()
+
+
+def _field(rec, op_name, field):
+    info = rec.results.get(op_name)
+    if info is None:
+        return None
+    return vars(info).get(field)
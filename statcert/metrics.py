@@ -0,0 +1,157 @@
+import bisect
+import math
+
+from aiohttp import web
+
+
+# seconds
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}  # sorted label items -> value
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+        for labels, value in self.values.items():
+            lines += self._samples(labels, value)
+        return lines
+
+    def _samples(self, labels, value):
+        return [f"{self.name}{_labels(labels)} {_number(value)}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        self.values[tuple(sorted(labels.items()))] = value
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = sorted(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        if key not in self.values:
+            # per bucket counts (the last one for +Inf), sum
+            self.values[key] = [[0] * (len(self.buckets) + 1), 0]
+        counts, _ = entry = self.values[key]
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def _samples(self, labels, value):
+        counts, total = value
+        samples = []
+        cumulative = 0
+        for bound, count in zip([*self.buckets, math.inf], counts):
+            cumulative += count
+            bucket_labels = (*labels, ("le", _number(bound)))
+            samples.append(
+                f"{self.name}_bucket{_labels(bucket_labels)} {cumulative}"
+            )
+        samples.append(f"{self.name}_sum{_labels(labels)} {_number(total)}")
+        samples.append(f"{self.name}_count{_labels(labels)} {cumulative}")
+        return samples
+
+
+class MetricsRegistry:
+    """Metrics of a running scan, in Prometheus' text format.
+
+    Metrics are created on first use, so operations can report them
+    without declaring them beforehand.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+
+    def counter(self, name, help=""):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help=""):
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name, help="", buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+    def _get(self, cls, name, help, **kwargs):
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, help, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"metric {name} is a {metric.type}")
+        return metric
+
+
+async def serve_metrics(registry, port, host="127.0.0.1"):
+    """Serve `registry` at http://host:port/metrics. Returns the runner,
+    whose `cleanup()` stops the server."""
+    async def handler(request):
+        return web.Response(
+            text=registry.render(),
+            content_type="text/plain",
+            charset="utf-8",
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(
+        f'{name}="{_escape(value)}"' for name, value in labels
+    ) + "}"
+
+
+def _escape(value):
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\"", "\\\"")
+        .replace("\n", "\\n")
+    )
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return str(value)
@@ -1,4 +1,12 @@
-from .info import Info, ProbeInfo, OCSPInfo
+from .info import (
+    Info,
+    ProbeInfo,
+    OCSPInfo,
+    ChainInfo,
+    TimingInfo,
+    StoredInfo,
+)
 from .record import Record
 from .operation import Operation
 from .certificate import Certificate
+from .store import CertificateStore
@@ -1,3 +1,5 @@
+import functools
+import hashlib
 import warnings
 
 from cryptography import x509
@@ -8,29 +10,53 @@ from .constants import CERTIFICATE_TYPES, RDN_DESCRIPTIONS
 from .info import Info
 
 
+def _memoized(func):
+    """Property computed on first access only; certificates are
+    immutable, so cached values never go stale."""
+    name = func.__name__
+
+    @property
+    @functools.wraps(func)
+    def wrapper(self):
+        try:
+            return self._memo[name]
+        except KeyError:
+            value = self._memo[name] = func(self)
+            return value
+
+    return wrapper
+
+
 class Certificate(Info):
     op_name = "cert"
 
+    # weakly referenced by CertificateStore
+    __slots__ = ("cert", "der", "_memo", "__weakref__")
+
     def __init__(self, cert):
+        self._memo = {}
         if isinstance(cert, x509.Certificate):
             self.cert = cert
+            self.der = cert.public_bytes(Encoding.DER)
         elif isinstance(cert, bytes):
             self.cert = x509.load_der_x509_certificate(cert)
+            self.der = cert
         elif isinstance(cert, str):
             cert_bytes = cert.encode("ascii")
             self.cert = x509.load_pem_x509_certificate(cert_bytes)
+            self.der = self.cert.public_bytes(Encoding.DER)
         else:
             raise ValueError(
                 f"can't create certificate from type {type(cert)}"
             )
 
     def __hash__(self):
-        return hash(self.cert.public_bytes(Encoding.DER))
+        return hash(self.fingerprint)
 
     def __eq__(self, other):
         if not isinstance(other, Certificate):
             return False
-        return hash(other) == hash(self)
+        return other.fingerprint == self.fingerprint
 
     def __repr__(self):
         return f"Certificate({self.serial_number[-8:]})"
@@ -41,7 +67,7 @@ class Certificate(Info):
     def as_bytes(self, format="der"):
         format = format.lower()
         if format == "der":
-            return self.cert.public_bytes(Encoding.DER)
+            return self.der
         elif format == "pem":
             return self.cert.public_bytes(Encoding.PEM)
         else:
@@ -51,8 +77,13 @@ class Certificate(Info):
 
     @property
     def __dict__(self):
+        return dict(self._fields)
+
+    @_memoized
+    def _fields(self):
         return {
             "serial_number": self.serial_number,
+            "fingerprint": self.fingerprint,
             "subject_name": self.subject_name,
             "issuer_name": self.issuer_name,
             "subject": self.subject,
@@ -68,45 +99,56 @@ class Certificate(Info):
             "bytes": bytes(self),
         }
 
-    @property
+    @_memoized
+    def fingerprint(self):
+        """Hex SHA-256 digest of the DER-encoded certificate."""
+        return hashlib.sha256(self.der).hexdigest()
+
+    @_memoized
     def serial_number(self):
         return f"{self.cert.serial_number:x}"
 
-    @property
+    @_memoized
     def subject_name(self):
-        return self.subject.get("organizationName") or self.subject["commonName"]
+        return (
+            self.subject.get("organizationName")
+            or self.subject.get("commonName")
+        )
 
-    @property
+    @_memoized
     def issuer_name(self):
-        return self.issuer["organizationName"]
+        return (
+            self.issuer.get("organizationName")
+            or self.issuer.get("commonName")
+        )
 
-    @property
+    @_memoized
     def subject(self):
         return {
             RDN_DESCRIPTIONS[attr.oid.dotted_string]: attr.value
             for attr in self.cert.subject
         }
 
-    @property
+    @_memoized
     def issuer(self):
         return {
             RDN_DESCRIPTIONS[attr.oid.dotted_string]: attr.value
             for attr in self.cert.issuer
         }
 
-    @property
+    @_memoized
     def not_before(self):
         return self.cert.not_valid_before
 
-    @property
+    @_memoized
     def not_after(self):
         return self.cert.not_valid_after
 
-    @property
+    @_memoized
     def duration(self):
         return self.not_after - self.not_before
 
-    @property
+    @_memoized
     def key_type(self):
         pk = self.cert.public_key()
         if isinstance(pk, rsa.RSAPublicKey):
@@ -120,16 +162,20 @@ class Certificate(Info):
             except AttributeError:
                 return type(pk), -1
 
-    @property
+    @_memoized
     def subject_alt_names(self):
-        return [
-            san.value
-            for san in self.cert.extensions.get_extension_for_class(
-                x509.extensions.SubjectAlternativeName
-            ).value
-        ]
+        try:
+            return [
+                san.value
+                for san in self.cert.extensions.get_extension_for_class(
+                    x509.extensions.SubjectAlternativeName
+                ).value
+            ]
+        except x509.ExtensionNotFound:
+            # as for most CA certificates
+            return []
 
-    @property
+    @_memoized
     def policy_oids(self):
         try:
             return [
@@ -141,7 +187,7 @@ class Certificate(Info):
         except x509.ExtensionNotFound:
             return []
 
-    @property
+    @_memoized
     def policy_type(self):
         matching = [
             CERTIFICATE_TYPES[oid]
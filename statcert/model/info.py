@@ -5,6 +5,10 @@ from dataclasses import dataclass
 
 
 class Info(ABC):  # not serializable
+    # kept per record, so subclasses list their attributes in __slots__
+    # too, instead of each instance having a dict
+    __slots__ = ()
+
     @property
     @abstractclassmethod
     def op_name(cls) -> str:
@@ -27,6 +31,10 @@ class ProbeInfo(Info):
     errors: list
     reason: str
 
+    __slots__ = (
+        "status", "home_page", "redirected", "attempts", "errors", "reason",
+    )
+
     @property
     def __dict__(self):
         return {
@@ -45,8 +53,67 @@ class OCSPInfo(Info):
 
     status: str
 
+    __slots__ = ("status",)
+
     @property
     def __dict__(self):
         return {
             "status": self.status
         }
+
+
+@dataclass
+class ChainInfo(Info):
+    op_name = "chain"
+
+    certificates: list  # list[Certificate], leaf first
+
+    __slots__ = ("certificates",)
+
+    @property
+    def __dict__(self):
+        return {
+            "length": len(self.certificates),
+            "subjects": [
+                cert.subject.get("commonName")
+                for cert in self.certificates
+            ],
+            "fingerprints": [cert.fingerprint for cert in self.certificates],
+            "bytes": [bytes(cert) for cert in self.certificates],
+        }
+
+
+class TimingInfo(Info):
+    """Seconds taken by each phase of an operation, which is named after
+    it (e.g. "timing" for the probe)."""
+
+    __slots__ = ("op_name", "redirects", "phases")
+
+    def __init__(self, op_name, redirects=0, **phases):
+        self.op_name = op_name
+        self.redirects = redirects
+        self.phases = phases
+
+    def __repr__(self):
+        return f"TimingInfo({self.op_name!r}, {self.phases!r})"
+
+    @property
+    def __dict__(self):
+        return {**self.phases, "redirects": self.redirects}
+
+
+class StoredInfo(Info):
+    """Result of an operation restored from its serialized form."""
+
+    __slots__ = ("op_name", "data")
+
+    def __init__(self, op_name, data):
+        self.op_name = op_name
+        self.data = data
+
+    def __repr__(self):
+        return f"StoredInfo({self.op_name!r}, {self.data!r})"
+
+    @property
+    def __dict__(self):
+        return self.data
@@ -4,12 +4,24 @@ from .record import Record
 
 
 class Operation(ABC):
+    limiter = None
+    metrics = None
+
     async def __aenter__(self):
         return self
 
     async def __aexit__(self, exc_type, exc_value, tb):
         return
 
+    async def throttle(self, destination=None):
+        if self.limiter:
+            await self.limiter.acquire(destination)
+
+    def count(self, name, help="", **labels):
+        """Increment a counter in the metrics registry, if there's one."""
+        if self.metrics:
+            self.metrics.counter(name, help).inc(**labels)
+
     @abstractstaticmethod
     def prepare_entry(record: Record) -> dict:
         ...
@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 from warnings import warn
 
-from .info import Info
+from .info import Info, StoredInfo
 
 
 @dataclass
@@ -11,6 +11,8 @@ class Record:
     results: dict
     user_info: dict
 
+    __slots__ = ("index", "domain", "results", "user_info")
+
     def __init__(self, index, domain, **kwargs):
         self.index = index
         self.domain = domain
@@ -28,6 +30,26 @@ class Record:
 
         return self
 
+    def serialize(self):
+        """Plain data version of this record, results included, which
+        can be turned back into a record with `Record.deserialize`."""
+        return {
+            "index": self.index,
+            "domain": self.domain,
+            "user_info": self.user_info,
+            "results": {
+                op_name: vars(res)
+                for op_name, res in self.results.items()
+            },
+        }
+
+    @classmethod
+    def deserialize(cls, data):
+        rec = cls(data["index"], data["domain"], **data["user_info"])
+        for op_name, res in data["results"].items():
+            rec.append(StoredInfo(op_name, res))
+        return rec
+
     @property
     def __dict__(self):
         ret = {
@@ -37,10 +59,9 @@ class Record:
         }
 
         for op_name, res in self.results.items():
-            info = {
-                f"{op_name}_{key}": value
+            ret.update(
+                (f"{op_name}_{key}", value)
                 for key, value in vars(res).items()
-            }
-            ret = {**ret, **info}
+            )
 
         return ret
@@ -0,0 +1,41 @@
+import hashlib
+import weakref
+
+from .certificate import Certificate
+
+
+class CertificateStore:
+    """Content-addressed certificates, keyed by SHA-256 fingerprint.
+
+    Records fetching the same certificate share a single `Certificate`,
+    which is only parsed once. Certificates are kept only while some
+    record still references them.
+    """
+
+    def __init__(self):
+        self.certificates = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.certificates)
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self.certificates
+
+    def get(self, fingerprint):
+        return self.certificates.get(fingerprint)
+
+    def get_or_create(self, der):
+        """Return the stored certificate with DER encoding `der`, creating
+        it if it's new."""
+        fingerprint = hashlib.sha256(der).hexdigest()
+        cert = self.certificates.get(fingerprint)
+        if cert is not None:
+            self.hits += 1
+            return cert
+
+        self.misses += 1
+        cert = Certificate(der)
+        self.certificates[fingerprint] = cert
+        return cert
@@ -1,2 +1,5 @@
 from .asynchttp import CertAiohttp
 from .ocsp import CheckOCSP
+from .handshake import CertHandshake
+from .connector import ConnectorSettings
+from .resolver import CachingResolver, DNSCache, HostNotFound
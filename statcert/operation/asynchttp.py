@@ -1,9 +1,14 @@
 import asyncio
 import ssl
+from urllib.parse import urlparse
 
 import aiohttp
 
-from ..model import Operation, Certificate, ProbeInfo
+from ..model import Operation, CertificateStore, ProbeInfo
+from ..retry import RetryPolicy
+from .connector import ConnectorSettings
+from .resolver import CachingResolver, HostNotFound, first_address
+from .tracing import PhaseTimer, timing_trace_config
 
 
 BROWSER_HEADERS = {
@@ -26,6 +31,10 @@ KNONW_ERRORS = [
     #     ErrorType,
     #     (should_retry, error_desc),
     # ],
+    [
+        HostNotFound,
+        (False, "host not found")
+    ],
     [
         aiohttp.ClientConnectorCertificateError,
         (False, "invalid certificate")
@@ -87,18 +96,32 @@ class CertAiohttp(Operation):
         default_timeout=2,
         lenient_timeout=60,
         fake_broser_headers=True,
+        cert_store=None,
+        resolver=None,
+        retry_policy=None,
+        connector_settings=None,
     ):
         self.allow_redirects = allow_redirects
         self.max_attempts = max_attempts
         self.default_timeout = default_timeout
         self.lenient_timeout = lenient_timeout
         self.fake_broser_headers = fake_broser_headers
+        # certificates, shared between the records serving them
+        self.cert_store = (
+            cert_store if cert_store is not None else CertificateStore()
+        )
+        self.resolver = resolver if resolver is not None else CachingResolver()
+        self.retry_policy = (
+            retry_policy if retry_policy is not None else RetryPolicy()
+        )
+        self.connector_settings = connector_settings or ConnectorSettings()
         self.session = None
 
     async def __aenter__(self):
         self.session = await aiohttp.ClientSession(
-            connector=aiohttp.TCPConnector(),
+            connector=self.connector_settings.connector(self.resolver),
             response_class=_ResponseWithCert,
+            trace_configs=[timing_trace_config()],
         ).__aenter__()
         return self
 
@@ -109,91 +132,134 @@ class CertAiohttp(Operation):
     def prepare_entry(record):
         return {"domain": record.domain}
 
-    async def execute(self, domain):
+    async def _throttle(self, host):
+        # per host limits apply to the address a domain resolves to, so
+        # domains served by the same CDN edge share one; the answer is
+        # cached for the request that follows
+        if self.limiter and self.limiter.host_rate:
+            host = await first_address(self.resolver, host) or host
+        await self.throttle(host)
+
+    async def execute(self, domain, retry_state=None):
         if not self.session:
             raise ValueError(
                 "Please call this function inside an async with block"
             )
 
-        status = "pending"
+        state = retry_state or self.retry_policy.start(self.default_timeout)
+        headers = BROWSER_HEADERS if self.fake_broser_headers else None
+        status = "unknown"
         site = None
         redirected = None
-        errors = []
-        attempts = 0
         cert = None
-        for attempt in range(self.max_attempts):
+        fallback = False
+        timer = PhaseTimer(["throttle"])
+        while True:
 
-            last_attempt = attempt == (self.max_attempts - 1)
-            schema = "https" if not last_attempt else "http"
-            url = f"{schema}://{domain}"
-            timeout = self.default_timeout
-            headers = BROWSER_HEADERS if self.fake_broser_headers else None
+            # the last attempt checks whether the domain is served over
+            # plain HTTP
+            https = not fallback and state.attempts < self.max_attempts - 1
+            url = f"{'https' if https else 'http'}://{domain}"
 
+            timer.start("throttle")
+            await self._throttle(urlparse(url).hostname)
+            timer.stop("throttle")
+            state.attempts += 1
             try:
                 async with await self.session.get(
                     url, headers=headers,
                     allow_redirects=self.allow_redirects,
-                    timeout=aiohttp.ClientTimeout(timeout)
+                    timeout=aiohttp.ClientTimeout(
+                        state.timeout if https else self.default_timeout
+                    ),
+                    trace_request_ctx=timer,
                 ) as resp:
-
                     site = str(resp.url)
                     redirected = len(resp.history) > 0
-                    https = (schema == "https")
                     cert = resp.peer_cert
 
-                    if https and not cert:
-                        status = "unknown"
-                        errors.append("unable to extract certificate"
-                                      " from response")
-                        continue
-                    elif not https and not cert:
-                        status = "missing"
-                        errors.append("no https support")
-                    else:
-                        status = "valid"
-                        cert = cert
-                        break
-
             except Exception as exc:
                 status = "unknown"
                 retry, error = _handle_errors(exc)
-                errors.append({
+                state.errors.append({
                     "type": error,
                     "message": str(exc),
                     "class": str(type(exc)),
                 })
 
-                if error == "timeout":
-                    if timeout != self.lenient_timeout:
-                        timeout = self.lenient_timeout
-                    else:
-                        retry = False
+            else:
+                if cert:
+                    status = "valid"
+                    break
+                elif not https:
+                    status = "missing"
+                    state.errors.append({
+                        "type": "no https support",
+                        "message": "no certificate received over HTTP",
+                        "class": None,
+                    })
+                    break
 
+                status = "unknown"
+                retry, error = True, "unable to extract certificate"
+                state.errors.append({
+                    "type": error,
+                    "message": "no certificate received with the response",
+                    "class": None,
+                })
+
+            self.count(
+                "statcert_probe_errors_total",
+                "Failed probe attempts, by error type",
+                type=error,
+            )
+            if not https:
+                break
+            if error == "timeout":
+                state.timeout = self.lenient_timeout
+
+            delay = self.retry_policy.retry_delay(state, error, retry)
+            if delay is None:
+                # out of HTTPS retries for this error, or for the whole
+                # scan; the plain HTTP attempt is made regardless
                 if retry:
+                    fallback = True
                     continue
-                else:
-                    break
+                break
+
+            self.count(
+                "statcert_probe_retries_total",
+                "Probe attempts retried after an error",
+            )
+            if self.retry_policy.defers(error, delay):
+                raise state.defer(delay)
+            await asyncio.sleep(delay)
 
         if status == "valid":
             reason = None
         else:
-            reason = errors[-1]["type"]
+            reason = state.errors[-1]["type"]
 
         return [
             ProbeInfo(
                 status=status,
                 home_page=site,
                 redirected=redirected,
-                attempts=attempts,
-                errors=errors,
+                attempts=state.attempts,
+                errors=state.errors,
                 reason=reason,
             ),
-            Certificate(cert) if cert else None,
+            self.cert_store.get_or_create(cert) if cert else None,
+            timer.info("timing", self.metrics, type(self).__name__),
         ]
 
 
-def _handle_errors(exception):
-    for [error_type, return_value] in KNONW_ERRORS:
+def _handle_errors(exception, known_errors=KNONW_ERRORS):
+    # aiohttp wraps resolver errors in a connection error
+    if isinstance(getattr(exception, "os_error", None), HostNotFound):
+        exception = exception.os_error
+
+    for [error_type, return_value] in known_errors:
         if isinstance(exception, error_type):
             return return_value
 
@@ -0,0 +1,157 @@
+import asyncio
+import sqlite3
+import time
+from collections import OrderedDict
+
+
+class AsyncLRUCache:
+    """In-memory LRU cache for values fetched asynchronously.
+
+    Concurrent lookups of a missing key share a single fetch. Failed
+    fetches aren't cached, so the next lookup tries again.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    async def get(self, key, fetch):
+        """Return the cached value for `key`, awaiting `fetch()` to get
+        it if it's missing."""
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        future = self.pending.get(key)
+        if future is None:
+            self.misses += 1
+            future = asyncio.ensure_future(fetch())
+            future.add_done_callback(
+                lambda fut: self._fetched(key, fut)
+            )
+            self.pending[key] = future
+        else:
+            self.hits += 1
+
+        # a cancelled caller must not cancel the fetch for the others
+        return await asyncio.shield(future)
+
+    def _fetched(self, key, future):
+        del self.pending[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        self.entries[key] = future.result()
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+class OCSPResponseCache:
+    """Persistent cache of OCSP responses, stored in a SQLite database.
+
+    Responses are keyed by the certificate's issuer key hash and serial
+    number, and are only returned while the current time is between
+    their thisUpdate and nextUpdate fields. The CertID hash accepted by
+    each responder is also kept.
+
+    Several processes may share the same file, e.g. with `--workers`:
+    each write is committed right away, and writers wait up to
+    `BUSY_TIMEOUT` seconds for each other.
+    """
+
+    BUSY_TIMEOUT = 30
+
+    def __init__(self, file):
+        self.file = file
+        self.db = None
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self):
+        self.db = sqlite3.connect(self.file, timeout=self.BUSY_TIMEOUT)
+        # readers don't block the writer, nor the writer the readers
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS ocsp_responses ("
+            " issuer_key_hash TEXT NOT NULL,"
+            " serial_number TEXT NOT NULL,"
+            " response BLOB NOT NULL,"
+            " this_update REAL NOT NULL,"
+            " next_update REAL NOT NULL,"
+            " PRIMARY KEY (issuer_key_hash, serial_number)"
+            ")"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responder_hashes ("
+            " url TEXT PRIMARY KEY,"
+            " hash TEXT NOT NULL"
+            ")"
+        )
+        self.db.commit()
+
+    def close(self):
+        if self.db:
+            self.db.commit()
+            self.db.close()
+            self.db = None
+
+    def get(self, key):
+        """Return the DER-encoded response for `key`, if still fresh."""
+        now = time.time()
+        row = self.db.execute(
+            "SELECT response FROM ocsp_responses"
+            " WHERE issuer_key_hash = ? AND serial_number = ?"
+            " AND this_update <= ? AND ? < next_update",
+            (*key, now, now),
+        ).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, response, this_update, next_update):
+        """Store a DER-encoded response; `this_update` and `next_update`
+        are POSIX timestamps."""
+        self.db.execute(
+            "INSERT OR REPLACE INTO ocsp_responses VALUES (?, ?, ?, ?, ?)",
+            (*key, response, this_update, next_update),
+        )
+        self.db.commit()
+
+    def get_responder_hashes(self):
+        """Return a dict of CertID hash names, by responder URL."""
+        return dict(self.db.execute("SELECT url, hash FROM responder_hashes"))
+
+    def put_responder_hash(self, url, hash_name):
+        self.db.execute(
+            "INSERT OR REPLACE INTO responder_hashes VALUES (?, ?)",
+            (url, hash_name),
+        )
+        self.db.commit()
+
+    def purge(self):
+        """Delete every expired response."""
+        self.db.execute(
+            "DELETE FROM ocsp_responses WHERE next_update <= ?",
+            (time.time(),),
+        )
+        self.db.commit()
@@ -0,0 +1,58 @@
+import inspect
+import ssl
+from dataclasses import dataclass
+
+import aiohttp
+
+
+_HAPPY_EYEBALLS_SUPPORTED = (
+    "happy_eyeballs_delay"
+    in inspect.signature(aiohttp.TCPConnector).parameters
+)
+
+
+@dataclass
+class ConnectorSettings:
+    """Connection pool settings of the operations making HTTP requests.
+
+    The same settings, and their SSL context, may be shared between
+    operations, so certificate authorities are only loaded once.
+    """
+
+    limit: int = 100                # connections (0 = unlimited)
+    limit_per_host: int = 0         # connections to a host (0 = unlimited)
+    keepalive_timeout: float = 15   # seconds (0 = close after each request)
+    happy_eyeballs_delay: float = None  # seconds (None = aiohttp's default)
+    ssl_context: ssl.SSLContext = None  # created on first use
+
+    def __post_init__(self):
+        unsupported = not _HAPPY_EYEBALLS_SUPPORTED
+        if self.happy_eyeballs_delay is not None and unsupported:
+            raise RuntimeError("Happy Eyeballs requires aiohttp >= 3.10")
+
+    def get_ssl_context(self):
+        if self.ssl_context is None:
+            self.ssl_context = ssl.create_default_context()
+        return self.ssl_context
+
+    def connector(self, resolver=None):
+        """New TCPConnector with these settings, resolving hosts with
+        `resolver`."""
+        kwargs = {}
+        if self.keepalive_timeout:
+            kwargs["keepalive_timeout"] = self.keepalive_timeout
+        else:
+            kwargs["force_close"] = True
+        if self.happy_eyeballs_delay is not None:
+            kwargs["happy_eyeballs_delay"] = self.happy_eyeballs_delay
+        if resolver is not None:
+            # the resolver caches hosts for as long as their records allow
+            kwargs["resolver"] = resolver
+            kwargs["use_dns_cache"] = False
+
+        return aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            ssl=self.get_ssl_context(),
+            **kwargs,
+        )
@@ -0,0 +1,226 @@
+import asyncio
+import socket
+import ssl
+
+from ..model import Operation, CertificateStore, ChainInfo, ProbeInfo
+from ..retry import RetryPolicy
+from .asynchttp import _handle_errors
+from .resolver import CachingResolver, HostNotFound, first_address
+
+
+HANDSHAKE_ERRORS = [
+    # [
+    #     ErrorType,
+    #     (should_retry, error_desc),
+    # ],
+    [
+        HostNotFound,
+        (False, "host not found")
+    ],
+    [
+        ssl.SSLCertVerificationError,
+        (False, "invalid certificate")
+    ],
+    [
+        ssl.SSLError,
+        (True, "TLS error")
+    ],
+    [
+        TimeoutError,
+        (True,  "timeout")
+    ],
+    [
+        asyncio.TimeoutError,
+        (True,  "timeout")
+    ],
+    [
+        OSError,
+        (True,  "connection error")
+    ],
+    # e.g. a UnicodeError for a name IDNA can't encode; a record shouldn't
+    # abort the whole scan
+    [
+        Exception,
+        (False, "unknown error")
+    ],
+]
+
+
+class CertHandshake(Operation):
+    """Fetch certificates with a bare TLS handshake.
+
+    Unlike CertAiohttp, no HTTP request is made: the connection is
+    dropped as soon as the handshake completes, so redirects are not
+    followed and `home_page` is left empty.
+    """
+
+    def __init__(
+        self,
+        port=443,
+        max_attempts=3,
+        default_timeout=2,
+        lenient_timeout=60,
+        ssl_context=None,
+        cert_store=None,
+        resolver=None,
+        retry_policy=None,
+    ):
+        self.port = port
+        self.max_attempts = max_attempts
+        self.default_timeout = default_timeout
+        self.lenient_timeout = lenient_timeout
+        self.ssl_context = ssl_context
+        # as for CertAiohttp.cert_store
+        self.cert_store = (
+            cert_store if cert_store is not None else CertificateStore()
+        )
+        self.resolver = resolver if resolver is not None else CachingResolver()
+        self.retry_policy = (
+            retry_policy if retry_policy is not None else RetryPolicy()
+        )
+
+    async def __aenter__(self):
+        if self.ssl_context is None:
+            self.ssl_context = ssl.create_default_context()
+        return self
+
+    @staticmethod
+    def prepare_entry(record):
+        return {"domain": record.domain}
+
+    async def _throttle(self, host):
+        # keyed like CertAiohttp._throttle
+        if self.limiter and self.limiter.host_rate:
+            host = await first_address(self.resolver, host) or host
+        await self.throttle(host)
+
+    async def execute(self, domain, retry_state=None):
+        state = retry_state or self.retry_policy.start(self.default_timeout)
+        status = "unknown"
+        chain = []
+        while True:
+            state.attempts += 1
+
+            await self._throttle(domain)
+            try:
+                chain = await asyncio.wait_for(
+                    self._handshake(domain, state.timeout),
+                    state.timeout,
+                )
+            except Exception as exc:
+                status = "unknown"
+                retry, error = _handle_errors(exc, HANDSHAKE_ERRORS)
+                state.errors.append({
+                    "type": error,
+                    "message": str(exc),
+                    "class": str(type(exc)),
+                })
+
+                if error == "timeout":
+                    state.timeout = self.lenient_timeout
+
+                self.count(
+                    "statcert_probe_errors_total",
+                    "Failed probe attempts, by error type",
+                    type=error,
+                )
+                if state.attempts == self.max_attempts:
+                    break
+                delay = self.retry_policy.retry_delay(state, error, retry)
+                if delay is None:
+                    break
+
+                self.count(
+                    "statcert_probe_retries_total",
+                    "Probe attempts retried after an error",
+                )
+                if self.retry_policy.defers(error, delay):
+                    raise state.defer(delay)
+                await asyncio.sleep(delay)
+                continue
+
+            if chain:
+                status = "valid"
+                break
+
+            status = "unknown"
+            state.errors.append({
+                "type": "unable to extract certificate",
+                "message": "no certificate received during handshake",
+                "class": None,
+            })
+            break
+
+        if status == "valid":
+            reason = None
+        else:
+            reason = state.errors[-1]["type"]
+
+        certs = [self.cert_store.get_or_create(cert) for cert in chain]
+        return [
+            ProbeInfo(
+                status=status,
+                home_page=None,
+                redirected=None,
+                attempts=state.attempts,
+                errors=state.errors,
+                reason=reason,
+            ),
+            certs[0] if certs else None,
+            ChainInfo(certs) if certs else None,
+        ]
+
+    async def _handshake(self, domain, timeout):
+        writer = await self._connect(domain, timeout)
+        try:
+            ssl_obj = writer.get_extra_info("ssl_object")
+            leaf = ssl_obj.getpeercert(binary_form=True)
+            if not leaf:
+                return []
+            chain = _peer_chain(ssl_obj)
+            return chain if chain else [leaf]
+        finally:
+            # skip the TLS shutdown, nothing was sent over the connection
+            writer.transport.abort()
+
+    async def _connect(self, domain, timeout):
+        """Connect to each address of `domain` in turn, until one
+        succeeds."""
+        hosts = await self.resolver.resolve(
+            domain, self.port, socket.AF_UNSPEC
+        )
+        error = None
+        for host in hosts:
+            try:
+                _, writer = await asyncio.open_connection(
+                    host["host"], host["port"],
+                    family=host["family"],
+                    ssl=self.ssl_context,
+                    server_hostname=domain,
+                    ssl_handshake_timeout=timeout,
+                )
+                return writer
+            except ssl.SSLError:
+                raise
+            except OSError as exc:
+                error = exc
+        raise error or HostNotFound(f"{domain}: no addresses")
+
+
+def _peer_chain(ssl_obj):
+    """Certificates sent by the peer, in DER format, leaf first."""
+    get_chain = (
+        getattr(ssl_obj, "get_unverified_chain", None)
+        or getattr(
+            getattr(ssl_obj, "_sslobj", None), "get_unverified_chain", None
+        )
+    )
+    if not get_chain:  # Python < 3.10
+        return []
+
+    return [
+        # Python < 3.13 gives certificate objects, encoded in PEM by default
+        cert if isinstance(cert, bytes)
+        else ssl.PEM_cert_to_DER_cert(cert.public_bytes())
+        for cert in get_chain() or []
+    ]
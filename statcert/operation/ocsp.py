@@ -1,5 +1,8 @@
 import asyncio
 import base64
+from dataclasses import dataclass, field
+from datetime import timezone
+from urllib.parse import urlparse
 
 import aiohttp
 from cryptography import x509
@@ -8,59 +11,295 @@ from cryptography.hazmat.primitives.hashes import SHA256, SHA1
 from cryptography.hazmat.primitives.serialization import Encoding
 
 from ..model import Operation, OCSPInfo
+from .cache import AsyncLRUCache, OCSPResponseCache
+from .connector import ConnectorSettings
+from .resolver import CachingResolver
+from .tracing import PhaseTimer, timing_trace_config
+
+
+# CertID hashes, in the order they're tried by default
+CERT_ID_HASHES = [SHA1, SHA256]
+
+# DER-encoded AlgorithmIdentifier for each CertID hash, as produced by
+# cryptography's OCSPRequestBuilder
+HASH_ALGORITHM_IDS = {
+    "sha1": bytes.fromhex("300906052b0e03021a0500"),
+    "sha256": bytes.fromhex("300d06096086480165030402010500"),
+}
+
+
+@dataclass
+class _PendingBatch:
+    issuer_cert: x509.Certificate
+    entries: list = field(default_factory=list)  # [(cert, future)]
+    timer: asyncio.TimerHandle = None
 
 
 class CheckOCSP(Operation):
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        issuer_cache_size=1024,
+        issuer_cache=None,
+        response_cache_file=None,
+        batch_size=1,
+        batch_delay=0.05,
+        resolver=None,
+        connector_settings=None,
+    ) -> None:
         self.session = None
+        self.resolver = resolver if resolver is not None else CachingResolver()
+        self.connector_settings = connector_settings or ConnectorSettings()
+        self.response_cache_file = response_cache_file
+        self.response_cache = None
+        # issuer certificates, by AIA caIssuers URL; may be shared
+        # between instances
+        self.issuer_cache = (
+            issuer_cache if issuer_cache is not None
+            else AsyncLRUCache(issuer_cache_size)
+        )
+        # certificates queried over the same responder and issuer within
+        # `batch_delay` seconds are sent in a single request
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.batch_unsupported = set()  # responder URLs
+        # CertID hash names accepted by each responder URL
+        self.responder_hashes = {}
+        self._batches = {}
+        self._batch_tasks = set()
 
     async def __aenter__(self):
-        self.session = await aiohttp.ClientSession().__aenter__()
+        self.session = await aiohttp.ClientSession(
+            connector=self.connector_settings.connector(self.resolver),
+            trace_configs=[timing_trace_config()],
+        ).__aenter__()
+        if self.response_cache_file:
+            self.response_cache = OCSPResponseCache(self.response_cache_file)
+            self.response_cache.open()
+            self.responder_hashes.update(
+                self.response_cache.get_responder_hashes()
+            )
 
         return self
 
     async def __aexit__(self, *args, **kwargs):
+        for batch in self._batches.values():
+            batch.timer.cancel()
+        for task in self._batch_tasks:
+            task.cancel()
+        self._batches.clear()
+
+        if self.response_cache:
+            self.response_cache.close()
+            self.response_cache = None
         return await self.session.__aexit__(*args, **kwargs)
 
     @staticmethod
     def prepare_entry(record):
-        return {"cert": record.results["cert"].cert}
+        cert = record.results.get("cert")
+        return {"cert": cert.cert if cert else None}
 
     async def execute(self, cert):
         if not self.session:
             raise ValueError(
                 "Please call this function inside an async with block"
             )
+        if cert is None:  # the probe didn't get one
+            return []
+
+        timer = PhaseTimer(["issuer", "throttle", "batch"])
+        status = await self._status(cert, timer)
+        return [
+            OCSPInfo(status),
+            timer.info("ocsp_timing", self.metrics, type(self).__name__),
+        ]
 
+    async def _status(self, cert, timer):
         ocsp_url, issuer_url = _extract_aia_info(cert)
         if not (ocsp_url and issuer_url):
-            return {"ocsp_status": "unavailable"}
+            return "unavailable"
 
-        raw_issuer_cert = await _get(self.session, issuer_url)
-        issuer_cert = x509.load_der_x509_certificate(
-            raw_issuer_cert
+        # includes waiting for a fetch started for another record
+        timer.start("issuer")
+        issuer_cert = await self.issuer_cache.get(
+            issuer_url, lambda: self._fetch_issuer(issuer_url)
         )
+        timer.stop("issuer")
+
+        if self.response_cache:
+            raw_ocsp_resp = self.response_cache.get(
+                _cert_id(cert, issuer_cert)
+            )
+            if raw_ocsp_resp:
+                ocsp_resp = x509.ocsp.load_der_ocsp_response(raw_ocsp_resp)
+                single = _single_response(ocsp_resp, cert.serial_number)
+                return _cert_status(single)
+
+        if self.batch_size > 1 and ocsp_url not in self.batch_unsupported:
+            timer.start("batch")
+            status = await self._batched_status(
+                cert, issuer_cert, ocsp_url, issuer_url
+            )
+            timer.stop("batch")
+            if status:
+                return status
 
-        for hash in [SHA1, SHA256]:
+        for hash in self._hash_order(ocsp_url):
             ocsp_request = _build_ocsp_req(cert, issuer_cert, hash)
             ocsp_req_url = f"{ocsp_url}/{ocsp_request}"
-            raw_ocsp_resp = await _get(self.session, ocsp_req_url)
+            timer.start("throttle")
+            await self.throttle(urlparse(ocsp_url).hostname)
+            timer.stop("throttle")
+            raw_ocsp_resp = await _get(self.session, ocsp_req_url, timer)
             ocsp_resp = x509.ocsp.load_der_ocsp_response(raw_ocsp_resp)
+            self._count_response(ocsp_url, ocsp_resp)
             if ocsp_resp.response_status != OCSPResponseStatus.SUCCESSFUL:
                 continue
 
-            if ocsp_resp.certificate_status == OCSPCertStatus.GOOD:
-                return [OCSPInfo("good")]
-            if ocsp_resp.certificate_status == OCSPCertStatus.UNKNOWN:
-                return [OCSPInfo("unknown")]
-            if ocsp_resp.certificate_status == OCSPCertStatus.REVOKED:
-                return [OCSPInfo("revoked")]
+            status = _cert_status(ocsp_resp)
+            if status:
+                self._learn_hash(ocsp_url, hash)
+                self._store_response(
+                    cert, issuer_cert, ocsp_resp, raw_ocsp_resp
+                )
+                return status
+
+        return "req_failed"
+
+    def _hash_order(self, ocsp_url):
+        preferred = self.responder_hashes.get(ocsp_url)
+        return sorted(CERT_ID_HASHES, key=lambda hash: hash.name != preferred)
+
+    def _learn_hash(self, ocsp_url, hash):
+        if self.responder_hashes.get(ocsp_url) == hash.name:
+            return
+        self.responder_hashes[ocsp_url] = hash.name
+        if self.response_cache:
+            self.response_cache.put_responder_hash(ocsp_url, hash.name)
 
-        return [OCSPInfo("req_failed")]
+    def _count_response(self, ocsp_url, ocsp_resp):
+        # tryLater responses are a sign of being throttled
+        self.count(
+            "statcert_ocsp_responses_total",
+            "OCSP responses, by responder host and response status",
+            host=urlparse(ocsp_url).hostname,
+            status=ocsp_resp.response_status.name.lower(),
+        )
+
+    def _store_response(self, cert, issuer_cert, single, raw_ocsp_resp):
+        if not self.response_cache:
+            return
+        this_update = _timestamp(single, "this_update")
+        next_update = _timestamp(single, "next_update")
+        # responses without nextUpdate mean newer information is always
+        # available, so they must not be reused
+        if this_update is None or next_update is None:
+            return
+        self.response_cache.put(
+            _cert_id(cert, issuer_cert), raw_ocsp_resp,
+            this_update, next_update,
+        )
+
+    async def _fetch_issuer(self, issuer_url):
+        await self.throttle(urlparse(issuer_url).hostname)
+        raw_issuer_cert = await _get(self.session, issuer_url)
+        return x509.load_der_x509_certificate(raw_issuer_cert)
+
+    async def _batched_status(self, cert, issuer_cert, ocsp_url, issuer_url):
+        """Queue `cert` to be queried along with other certificates from
+        the same responder and issuer.
+
+        Returns None if the batch failed or had a single certificate, in
+        which case the caller should query it on its own.
+        """
+        loop = asyncio.get_running_loop()
+        key = (ocsp_url, issuer_url)
+
+        batch = self._batches.get(key)
+        if batch is None:
+            batch = _PendingBatch(issuer_cert)
+            batch.timer = loop.call_later(
+                self.batch_delay, self._flush_batch, key
+            )
+            self._batches[key] = batch
 
+        future = loop.create_future()
+        batch.entries.append((cert, future))
+        if len(batch.entries) >= self.batch_size:
+            self._flush_batch(key)
 
-async def _get(client, url):
-    async with client.get(url) as resp:
+        return await future
+
+    def _flush_batch(self, key):
+        batch = self._batches.pop(key)
+        batch.timer.cancel()
+
+        task = asyncio.ensure_future(self._send_batch(key[0], batch))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _send_batch(self, ocsp_url, batch):
+        statuses = {}
+        try:
+            if len(batch.entries) > 1:
+                statuses = await self._post_batch(ocsp_url, batch)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        except ValueError:  # malformed response
+            self.batch_unsupported.add(ocsp_url)
+        finally:
+            for cert, future in batch.entries:
+                if not future.done():
+                    future.set_result(statuses.get(cert.serial_number))
+
+    async def _post_batch(self, ocsp_url, batch):
+        certs = [cert for cert, _ in batch.entries]
+
+        # a responder rejecting the batch may only reject the hash of its
+        # CertIDs, so the batch is retried once with the next one before
+        # giving up on batches
+        for hash in self._hash_order(ocsp_url)[:2]:
+            ocsp_request = _build_batch_ocsp_req(
+                certs, batch.issuer_cert, hash
+            )
+            await self.throttle(urlparse(ocsp_url).hostname)
+            async with self.session.post(
+                ocsp_url,
+                data=ocsp_request,
+                headers={"Content-Type": "application/ocsp-request"},
+            ) as resp:
+                raw_ocsp_resp = await resp.read()
+
+            ocsp_resp = x509.ocsp.load_der_ocsp_response(raw_ocsp_resp)
+            self._count_response(ocsp_url, ocsp_resp)
+            if ocsp_resp.response_status == OCSPResponseStatus.SUCCESSFUL:
+                break
+        if (
+            ocsp_resp.response_status != OCSPResponseStatus.SUCCESSFUL
+            or not hasattr(ocsp_resp, "responses")  # cryptography < 37
+        ):
+            self.batch_unsupported.add(ocsp_url)
+            return {}
+
+        statuses = {}
+        for cert in certs:
+            single = _single_response(ocsp_resp, cert.serial_number)
+            status = _cert_status(single) if single else None
+            if status:
+                statuses[cert.serial_number] = status
+                self._store_response(
+                    cert, batch.issuer_cert, single, raw_ocsp_resp
+                )
+
+        if statuses:
+            self._learn_hash(ocsp_url, hash)
+        # responders that only answer for the first certificate
+        if len(statuses) < len(certs):
+            self.batch_unsupported.add(ocsp_url)
+        return statuses
+
+
+async def _get(client, url, timer=None):
+    async with client.get(url, trace_request_ctx=timer) as resp:
         raw = await resp.read()
 
     return raw
@@ -74,6 +313,76 @@ def _build_ocsp_req(cert, issuer_cert, hash):
     return req_path.decode('ascii')
 
 
+def _build_batch_ocsp_req(certs, issuer_cert, hash):
+    """DER-encoded OCSP request for several certificates of the same
+    issuer (cryptography only builds single certificate requests)."""
+    requests = []
+    for cert in certs:
+        req = x509.ocsp.OCSPRequestBuilder().add_certificate(
+            cert, issuer_cert, hash()
+        ).build()
+        serial = req.serial_number
+        cert_id = _der(0x30, b"".join([
+            HASH_ALGORITHM_IDS[req.hash_algorithm.name],
+            _der(0x04, req.issuer_name_hash),
+            _der(0x04, req.issuer_key_hash),
+            _der(0x02, serial.to_bytes(serial.bit_length() // 8 + 1, "big")),
+        ]))
+        requests.append(_der(0x30, cert_id))
+
+    # OCSPRequest { TBSRequest { requestList { Request* } } }
+    return _der(0x30, _der(0x30, _der(0x30, b"".join(requests))))
+
+
+def _der(tag, content):
+    length = len(content)
+    if length < 0x80:
+        encoded_length = bytes([length])
+    else:
+        size = (length.bit_length() + 7) // 8
+        encoded_length = bytes([0x80 | size]) + length.to_bytes(size, "big")
+    return bytes([tag]) + encoded_length + content
+
+
+def _cert_id(cert, issuer_cert):
+    req = x509.ocsp.OCSPRequestBuilder().add_certificate(
+        cert, issuer_cert, SHA1()
+    ).build()
+    return req.issuer_key_hash.hex(), f"{req.serial_number:x}"
+
+
+def _single_response(ocsp_resp, serial_number):
+    """The part of `ocsp_resp` about the certificate `serial_number`."""
+    if not hasattr(ocsp_resp, "responses"):  # cryptography < 37
+        return ocsp_resp
+    for single in ocsp_resp.responses:
+        if single.serial_number == serial_number:
+            return single
+    return None
+
+
+def _cert_status(ocsp_resp):
+    if ocsp_resp.certificate_status == OCSPCertStatus.GOOD:
+        return "good"
+    if ocsp_resp.certificate_status == OCSPCertStatus.UNKNOWN:
+        return "unknown"
+    if ocsp_resp.certificate_status == OCSPCertStatus.REVOKED:
+        return "revoked"
+    return None
+
+
+def _timestamp(ocsp_resp, name):
+    # newer versions of cryptography deprecate naive datetimes in
+    # favour of *_utc properties
+    if hasattr(ocsp_resp, f"{name}_utc"):
+        value = getattr(ocsp_resp, f"{name}_utc")
+    else:
+        value = getattr(ocsp_resp, name)
+        if value is not None:
+            value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp() if value is not None else None
+
+
 def _extract_aia_info(cert):
     aia_ext = cert.extensions.get_extension_for_class(
         x509.AuthorityInformationAccess
@@ -0,0 +1,248 @@
+import asyncio
+import socket
+import time
+import weakref
+from collections import OrderedDict
+
+from aiohttp.abc import AbstractResolver
+
+try:
+    import aiodns
+except ImportError:  # optional, hosts are looked up with getaddrinfo
+    aiodns = None
+
+
+# seconds getaddrinfo answers are kept, as their TTL isn't known
+DEFAULT_TTL = 60
+
+# getaddrinfo errors meaning the name doesn't exist, or has no addresses
+_NOT_FOUND_ERRNOS = {
+    errno for errno in [
+        getattr(socket, "EAI_NONAME", None),
+        getattr(socket, "EAI_NODATA", None),
+    ]
+    if errno is not None
+}
+
+
+class HostNotFound(OSError):
+    """The domain doesn't exist (NXDOMAIN), or has no addresses."""
+
+
+class DNSCache:
+    """Addresses of hosts, kept for the TTL of their records.
+
+    Hosts that weren't found are kept for `negative_ttl` seconds, so a
+    dead domain is only looked up once. Other failures, such as timeouts,
+    aren't cached. Concurrent lookups of a missing host share a single
+    query.
+    """
+
+    def __init__(self, maxsize=100_000, negative_ttl=300, max_ttl=3600):
+        self.maxsize = maxsize
+        self.negative_ttl = negative_ttl
+        self.max_ttl = max_ttl
+        self.entries = OrderedDict()  # key -> (expiry, addresses or error)
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+
+    async def get(self, key, lookup):
+        """Return the cached addresses for `key`, awaiting `lookup()`,
+        which returns them along with their TTL, if they're missing or
+        expired."""
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return _answer(entry[1])
+
+        future = self.pending.get(key)
+        if (
+            future is None
+            # left over by an event loop that was closed mid lookup
+            or future.get_loop() is not asyncio.get_running_loop()
+        ):
+            self.misses += 1
+            future = asyncio.ensure_future(self._lookup(key, lookup))
+            future.add_done_callback(
+                lambda fut: self._looked_up(key, fut)
+            )
+            self.pending[key] = future
+        else:
+            self.hits += 1
+
+        # a cancelled caller must not cancel the lookup for the others
+        return _answer(await asyncio.shield(future))
+
+    async def _lookup(self, key, lookup):
+        try:
+            addresses, ttl = await lookup()
+        except HostNotFound as exc:
+            self._store(key, exc, self.negative_ttl)
+            raise
+        self._store(key, addresses, min(ttl, self.max_ttl))
+        return addresses
+
+    def _looked_up(self, key, future):
+        if self.pending.get(key) is future:
+            del self.pending[key]
+        if not future.cancelled():
+            # mark errors as retrieved, even if every caller was cancelled
+            future.exception()
+
+    def _store(self, key, answer, ttl):
+        if ttl <= 0:
+            return
+        self.entries[key] = (time.monotonic() + ttl, answer)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+# shared by every CachingResolver in the process, unless given another
+SHARED_CACHE = DNSCache()
+
+
+class GetaddrinfoLookup:
+    """Look hosts up with the system's getaddrinfo, in a thread. TTLs
+    aren't known this way, so every answer is kept for `ttl` seconds."""
+
+    def __init__(self, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+
+    async def lookup(self, host, family):
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await loop.getaddrinfo(
+                host, None, family=family, type=socket.SOCK_STREAM,
+                flags=socket.AI_ADDRCONFIG,
+            )
+        except socket.gaierror as exc:
+            if exc.errno in _NOT_FOUND_ERRNOS:
+                raise HostNotFound(exc.errno, f"{host}: {exc.strerror}")
+            raise
+        addresses = [
+            (info_family, address[0])
+            for info_family, _, _, _, address in infos
+        ]
+        return addresses, self.ttl
+
+
+class AiodnsLookup:
+    """Look hosts up with aiodns, asking `nameservers` (the system's by
+    default) for their A and AAAA records, and keeping them for their
+    TTL."""
+
+    def __init__(self, nameservers=None):
+        if aiodns is None:
+            raise RuntimeError(
+                "Asynchronous DNS requires aiodns; install it with"
+                " `pip install statcert[dns]`"
+            )
+        self.nameservers = nameservers
+        self._resolvers = weakref.WeakKeyDictionary()  # loop -> resolver
+
+    async def lookup(self, host, family):
+        queries = {
+            socket.AF_INET: ["A"],
+            socket.AF_INET6: ["AAAA"],
+        }.get(family, ["A", "AAAA"])
+        answers = await asyncio.gather(*(
+            self._query(host, qtype) for qtype in queries
+        ))
+
+        addresses = []
+        ttls = []
+        for qtype, records in zip(queries, answers):
+            qfamily = socket.AF_INET if qtype == "A" else socket.AF_INET6
+            for record in records:
+                addresses.append((qfamily, record.host))
+                ttls.append(record.ttl)
+        if not addresses:
+            raise HostNotFound(f"{host}: no addresses")
+        return addresses, min(ttls)
+
+    async def _query(self, host, qtype):
+        try:
+            return await self._resolver().query(host, qtype)
+        except aiodns.error.DNSError as exc:
+            code, message = exc.args[0], exc.args[-1]
+            if code == aiodns.error.ARES_ENOTFOUND:
+                raise HostNotFound(f"{host}: {message}") from None
+            if code == aiodns.error.ARES_ENODATA:
+                return []
+            raise OSError(f"{host}: {message}") from exc
+
+    def _resolver(self):
+        loop = asyncio.get_running_loop()
+        resolver = self._resolvers.get(loop)
+        if resolver is None:
+            resolver = self._resolvers[loop] = aiodns.DNSResolver(
+                nameservers=self.nameservers, loop=loop,
+            )
+        return resolver
+
+
+def default_lookup(nameservers=None, ttl=DEFAULT_TTL):
+    """aiodns if it's installed (or nameservers were given), getaddrinfo
+    otherwise, keeping its answers for `ttl` seconds."""
+    if aiodns is not None or nameservers:
+        return AiodnsLookup(nameservers)
+    return GetaddrinfoLookup(ttl)
+
+
+class CachingResolver(AbstractResolver):
+    """aiohttp resolver answering from a `DNSCache`, shared between all
+    resolvers in the process by default, and looking up what's missing
+    from it with `lookup`.
+
+    Hosts that don't exist raise `HostNotFound`, an OSError, so probes can
+    give up on them without retrying.
+    """
+
+    def __init__(self, lookup=None, cache=None):
+        self.lookup = lookup if lookup is not None else default_lookup()
+        self.cache = cache if cache is not None else SHARED_CACHE
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        addresses = await self.cache.get(
+            (host, family), lambda: self.lookup.lookup(host, family)
+        )
+        return [
+            {
+                "hostname": host,
+                "host": address,
+                "port": port,
+                "family": address_family,
+                "proto": socket.IPPROTO_TCP,
+                "flags": socket.AI_NUMERICHOST | socket.AI_NUMERICSERV,
+            }
+            for address_family, address in addresses
+        ]
+
+    async def close(self):
+        pass
+
+
+async def first_address(resolver, host):
+    """First address `host` resolves to with `resolver`, or None if it
+    can't be resolved."""
+    try:
+        addresses = await resolver.resolve(host, 0, socket.AF_UNSPEC)
+    except OSError:
+        return None
+    return addresses[0]["host"] if addresses else None
+
+
+def _answer(answer):
+    if isinstance(answer, HostNotFound):
+        # a new one for each caller, so tracebacks don't pile up
+        raise HostNotFound(*answer.args)
+    return answer
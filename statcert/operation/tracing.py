@@ -0,0 +1,95 @@
+import time
+
+import aiohttp
+
+from ..model import TimingInfo
+
+
+class PhaseTimer:
+    """Time spent in each phase of fetching a record, gathered from the
+    aiohttp trace hooks of `timing_trace_config`, and from the phases in
+    `extra_phases`, timed by the operation itself."""
+
+    def __init__(self, extra_phases=()):
+        self.created = time.monotonic()
+        self.spans = dict.fromkeys(extra_phases, 0)  # phase -> seconds
+        self.started = {}   # phase -> start time
+        self.redirects = 0
+
+    def start(self, phase):
+        self.started[phase] = time.monotonic()
+
+    def stop(self, phase):
+        start = self.started.pop(phase, None)
+        if start is not None:
+            self.add(phase, time.monotonic() - start)
+
+    def stop_all(self):
+        for phase in list(self.started):
+            self.stop(phase)
+
+    def add(self, phase, seconds):
+        self.spans[phase] = self.spans.get(phase, 0) + seconds
+
+    def info(self, op_name, metrics=None, operation=None):
+        """Build a TimingInfo, with each phase on its own: `dns`, `connect`
+        (TCP and TLS, without DNS), `http` (from sending requests to
+        receiving response headers, without connecting) and `total`,
+        along with any phases added directly."""
+        spans = dict(self.spans)
+        dns = spans.pop("dns", 0)
+        connection = spans.pop("connection", 0)
+        request = spans.pop("request", 0)
+        phases = {
+            "dns": dns,
+            "connect": max(connection - dns, 0),
+            "http": max(request - connection, 0),
+            **spans,
+            "total": time.monotonic() - self.created,
+        }
+        if metrics:
+            histogram = metrics.histogram(
+                "statcert_phase_seconds",
+                "Time taken by each phase of an operation on a record",
+            )
+            for phase, seconds in phases.items():
+                histogram.observe(seconds, operation=operation, phase=phase)
+        return TimingInfo(op_name, redirects=self.redirects, **phases)
+
+
+def timing_trace_config():
+    """TraceConfig timing requests made with a `PhaseTimer` as their
+    `trace_request_ctx`."""
+    def hook(phase, stop=False):
+        async def on_event(session, ctx, params):
+            timer = ctx.trace_request_ctx
+            if not isinstance(timer, PhaseTimer):
+                return
+            if stop:
+                timer.stop(phase)
+            else:
+                timer.start(phase)
+        return on_event
+
+    async def on_redirect(session, ctx, params):
+        timer = ctx.trace_request_ctx
+        if isinstance(timer, PhaseTimer):
+            timer.stop("request")
+            timer.redirects += 1
+
+    async def on_exception(session, ctx, params):
+        # whatever phase the request failed in is over
+        timer = ctx.trace_request_ctx
+        if isinstance(timer, PhaseTimer):
+            timer.stop_all()
+
+    config = aiohttp.TraceConfig()
+    config.on_dns_resolvehost_start.append(hook("dns"))
+    config.on_dns_resolvehost_end.append(hook("dns", stop=True))
+    config.on_connection_create_start.append(hook("connection"))
+    config.on_connection_create_end.append(hook("connection", stop=True))
+    config.on_request_start.append(hook("request"))
+    config.on_request_end.append(hook("request", stop=True))
+    config.on_request_exception.append(on_exception)
+    config.on_request_redirect.append(on_redirect)
+    return config
@@ -0,0 +1,90 @@
+import asyncio
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """Allow up to `rate` acquisitions per second, with bursts of up
+    to `burst` acquisitions after idle periods.
+
+    Waiters are served in arrival order.
+    """
+
+    def __init__(self, rate, burst=None):
+        if rate <= 0:
+            raise ValueError(f"rate must be positive, got {rate}")
+        self.rate = rate
+        self.burst = max(burst or rate, 1)
+        self.tokens = self.burst
+        self.last_refill = None
+        self._lock = None
+
+    def _refill(self, now):
+        if self.last_refill is not None:
+            elapsed = now - self.last_refill
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.last_refill = now
+
+    def idle_since(self, now):
+        """Whether the bucket would be full at time `now`."""
+        if self.last_refill is None:
+            return True
+        missing = self.burst - self.tokens
+        return now - self.last_refill >= missing / self.rate
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            self._refill(loop.time())
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill(loop.time())
+            self.tokens -= 1
+
+
+class RateLimiter:
+    """Global and per-destination request rate limits.
+
+    `rate` caps the total number of requests per second, while
+    `host_rate` caps the requests per second sent to any single
+    destination (an address or host name, as given by the operations).
+    Either may be None to disable it.
+    """
+
+    PRUNE_INTERVAL = 1000
+
+    def __init__(self, rate=None, host_rate=None, host_burst=None):
+        self.global_bucket = TokenBucket(rate) if rate else None
+        self.host_rate = host_rate
+        self.host_burst = host_burst
+        self.host_buckets = OrderedDict()
+        self._acquired = 0
+
+    async def acquire(self, destination=None):
+        if self.host_rate and destination:
+            bucket = self.host_buckets.get(destination)
+            if bucket is None:
+                bucket = TokenBucket(self.host_rate, self.host_burst)
+                self.host_buckets[destination] = bucket
+            else:
+                self.host_buckets.move_to_end(destination)
+            await bucket.acquire()
+
+        if self.global_bucket:
+            await self.global_bucket.acquire()
+
+        self._acquired += 1
+        if self._acquired % self.PRUNE_INTERVAL == 0:
+            self._prune()
+
+    def _prune(self):
+        # buckets are kept in least recently used order, and a full
+        # bucket behaves just like a freshly created one
+        now = asyncio.get_running_loop().time()
+        while self.host_buckets:
+            destination, bucket = next(iter(self.host_buckets.items()))
+            if bucket._lock.locked() or not bucket.idle_since(now):
+                break
+            del self.host_buckets[destination]
@@ -0,0 +1,140 @@
+import random
+import time
+from collections import Counter
+
+
+# seconds; retries of a record's third failure on may wait a second or
+# more, and are then deferred
+DEFAULT_BASE_DELAY = 0.25
+DEFAULT_DEFER_AFTER = 1
+
+# retries per record
+DEFAULT_RETRY_RATIO = 0.2
+
+# most attempts of a record that may fail with each error type, as named
+# by the operations' known errors; other retryable errors are only
+# limited by the operation's max_attempts
+DEFAULT_ERROR_BUDGETS = {
+    "connection error": 2,
+    "TLS error": 2,
+    "timeout": 2,
+    "invalid HTTP response": 3,
+}
+
+
+class DeferredRetry(Exception):
+    """Raised by an operation to retry a record at the end of the scan,
+    instead of waiting for it. `run_operation` requeues the record, and
+    passes `state` back to the operation as `retry_state`."""
+
+    def __init__(self, state):
+        super().__init__(state)
+        self.state = state
+
+
+class RetryState:
+    """Attempts made on a record by an operation, carried over when its
+    retry is deferred."""
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+        self.attempts = 0
+        self.errors = []
+        self.failures = Counter()  # error type -> failed attempts
+        self.deferrals = 0
+        self.not_before = 0  # time.monotonic() of the deferred retry
+
+    def defer(self, delay):
+        """DeferredRetry for this record, `delay` seconds from now."""
+        self.deferrals += 1
+        self.not_before = time.monotonic() + delay
+        return DeferredRetry(self)
+
+
+class RetryBudget:
+    """Caps retries across a whole scan to a fraction of the records.
+
+    Each record deposits `ratio` retries, on top of `min_retries`, and
+    each retry withdraws one, so a wave of failures, such as a down
+    network, doesn't multiply the load of the scan.
+    """
+
+    def __init__(self, ratio=DEFAULT_RETRY_RATIO, min_retries=10):
+        self.ratio = ratio
+        self.balance = min_retries
+
+    def deposit(self):
+        self.balance += self.ratio
+
+    def withdraw(self):
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+
+class RetryPolicy:
+    """When to retry a failed attempt, and how long to wait before it.
+
+    Retries back off exponentially from `base_delay`, up to `max_delay`,
+    with full jitter. Each error type may fail at most the number of
+    attempts given in `budgets`, and the retries of all records are
+    capped by `retry_budget` (None for no cap). Retries that would wait
+    `defer_after` seconds or more are deferred to the end of the scan, so
+    they don't hold on to a concurrency slot meanwhile.
+
+    The first failure of a record with an error type in `deferred_errors`
+    is always deferred, without waiting and whatever the budgets; only
+    its later failures are subject to them.
+    """
+
+    def __init__(
+        self,
+        base_delay=DEFAULT_BASE_DELAY,
+        max_delay=30,
+        jitter=True,
+        budgets=DEFAULT_ERROR_BUDGETS,
+        retry_budget=None,
+        defer_after=DEFAULT_DEFER_AFTER,
+        deferred_errors=(),
+    ):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.budgets = dict(budgets)
+        self.retry_budget = retry_budget
+        self.defer_after = defer_after
+        self.deferred_errors = set(deferred_errors)
+
+    def start(self, timeout):
+        """State of a new record."""
+        if self.retry_budget:
+            self.retry_budget.deposit()
+        return RetryState(timeout)
+
+    def retry_delay(self, state, error, retryable):
+        """Account for an attempt that failed with `error`, and return how
+        many seconds to wait before retrying, or None to give up."""
+        state.failures[error] += 1
+        if not retryable:
+            return None
+        if error in self.deferred_errors and not state.deferrals:
+            return 0
+        budget = self.budgets.get(error)
+        if budget is not None and state.failures[error] >= budget:
+            return None
+        if self.retry_budget and not self.retry_budget.withdraw():
+            return None
+        return self.delay(sum(state.failures.values()))
+
+    def defers(self, error, delay):
+        """Whether a retry should be deferred to the end of the scan."""
+        return error in self.deferred_errors or delay >= self.defer_after
+
+    def delay(self, failures):
+        """Backoff before the retry following `failures` failed
+        attempts."""
+        delay = min(self.max_delay, self.base_delay * 2 ** (failures - 1))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
@@ -1,8 +1,84 @@
+import asyncio
+import itertools
+import time
 from contextlib import AsyncExitStack
 
+from .retry import DeferredRetry
+
+
+DEFAULT_MAX_IN_FLIGHT = 100
+
 
 async def strategy_naive_sequential(coroutines):
-    return [await coro() for coro in coroutines]
+    results = []
+    next_coroutine = _puller(coroutines)
+    while (coro := await next_coroutine()) is not None:
+        rec = await coro()
+        if rec is not None:
+            results.append(rec)
+    return results
+
+
+def strategy_worker_pool(max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """Run up to `max_in_flight` coroutines concurrently.
+
+    A fixed number of workers pull from the same iterator, or async
+    iterator, so coroutines are only created as slots free up. Results are returned in the order
+    they're done, leaving out those that are None.
+    """
+    if max_in_flight < 1:
+        raise ValueError(
+            f"max_in_flight must be at least 1, got {max_in_flight}"
+        )
+
+    async def strategy(coroutines):
+        next_coroutine = _puller(coroutines)
+        results = []
+
+        async def worker():
+            while (coro := await next_coroutine()) is not None:
+                rec = await coro()
+                if rec is not None:
+                    results.append(rec)
+
+        workers = [
+            asyncio.ensure_future(worker())
+            for _ in range(max_in_flight)
+        ]
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+
+        return results
+
+    return strategy
+
+
+def _puller(coroutines):
+    """Async function returning the next of `coroutines`, an iterable or
+    an async iterable, or None once they're exhausted."""
+    if not hasattr(coroutines, "__aiter__"):
+        iterator = iter(coroutines)
+
+        async def pull():
+            return next(iterator, None)
+
+        return pull
+
+    iterator = coroutines.__aiter__()
+    # workers may not await an async generator while another one does
+    lock = asyncio.Lock()
+
+    async def pull():
+        async with lock:
+            try:
+                return await iterator.__anext__()
+            except StopAsyncIteration:
+                return None
+
+    return pull
 
 
 async def run_operation(
@@ -10,26 +86,143 @@ async def run_operation(
     records,
     strategy=strategy_naive_sequential,
     callback=None,
+    limiter=None,
+    checkpoint=None,
+    metrics=None,
+    retry_strategy=None,
+    stream=False,
 ):
-    def create_task(rec):
+    """Run `operations` on each of `records`, and return them ordered by
+    `Record.index`.
+
+    `records` may also be an async iterable, e.g. when they're received
+    from elsewhere, in which case `strategy` gets an async iterable of
+    coroutines; the strategies above take either.
+
+    Records whose retries are deferred by an operation are requeued once
+    every other record is done, and run with `retry_strategy` (by default,
+    `strategy`), e.g. with a lower concurrency for slow hosts.
+
+    With `stream`, records are only passed to `callback` as they're done,
+    in that order, and None is returned: no record is kept once it's
+    done, so memory doesn't grow with the number of records.
+    """
+    if metrics:
+        records_done = metrics.counter(
+            "statcert_records_total", "Records fetched"
+        )
+        in_flight = metrics.gauge(
+            "statcert_records_in_flight", "Records being fetched"
+        )
+        operation_seconds = metrics.histogram(
+            "statcert_operation_seconds",
+            "Time taken by each operation on a record",
+        )
+        records_deferred = metrics.counter(
+            "statcert_records_deferred_total",
+            "Records whose retries were deferred to the end of the scan",
+        )
+
+    # records whose retries were deferred by an operation, along with the
+    # position of that operation and its RetryState
+    deferred = []
+
+    def result(rec):
+        # what the tasks return to the strategy, which keeps it
+        return None if stream else rec
+
+    def create_task(rec, start=0, retry_state=None):
         async def task():
-            for operation in operations:
-                inp = operation.prepare_entry(rec)
-                res = await operation.execute(**inp)
-                [rec.append(info) for info in res]
-                if callback:
-                    await callback(rec)
+            if retry_state:
+                await asyncio.sleep(retry_state.not_before - time.monotonic())
+            if metrics:
+                in_flight.inc()
+            try:
+                for pos in range(start, len(operations)):
+                    operation = operations[pos]
+                    inp = operation.prepare_entry(rec)
+                    if retry_state and pos == start:
+                        inp["retry_state"] = retry_state
+                    start_time = time.monotonic()
+                    try:
+                        res = await operation.execute(**inp)
+                    except DeferredRetry as exc:
+                        deferred.append((rec, pos, exc.state))
+                        if metrics:
+                            records_deferred.inc()
+                        return result(rec)
+                    [rec.append(info) for info in res]
+                    if metrics:
+                        operation_seconds.observe(
+                            time.monotonic() - start_time,
+                            operation=type(operation).__name__,
+                        )
+            finally:
+                if metrics:
+                    in_flight.dec()
+            if metrics:
+                records_done.inc()
+
+            if checkpoint:
+                checkpoint.save(rec)
+            if callback:
+                await callback(rec)
 
-            return rec
+            return result(rec)
 
         return task
 
-    coros = [create_task(rec) for rec in records]
+    def restore_task(rec):
+        async def task():
+            if callback:
+                await callback(rec)
+
+            return result(rec)
+
+        return task
+
+    if hasattr(records, "__aiter__"):
+        async def async_coros():
+            if checkpoint:
+                for rec in checkpoint.restore():
+                    yield restore_task(rec)
+            async for rec in records:
+                if not checkpoint or rec.index not in checkpoint:
+                    yield create_task(rec)
+
+        coros = async_coros()
+    elif checkpoint:
+        # records finished in a previous run are passed along as they
+        # were, before any new ones
+        coros = itertools.chain(
+            (restore_task(rec) for rec in checkpoint.restore()),
+            (
+                create_task(rec) for rec in records
+                if rec.index not in checkpoint
+            ),
+        )
+    else:
+        coros = (create_task(rec) for rec in records)
 
     async with AsyncExitStack() as stack:
         for operation in operations:
+            if limiter:
+                operation.limiter = limiter
+            if metrics:
+                operation.metrics = metrics
             await stack.enter_async_context(operation)
 
         results = await strategy(coros)
 
-    return results
+        # deferred records are already in the results, and are completed
+        # in place, at the end of the scan
+        while deferred:
+            retries = sorted(deferred, key=lambda item: item[2].not_before)
+            deferred.clear()
+            await (retry_strategy or strategy)(
+                create_task(rec, pos, state) for rec, pos, state in retries
+            )
+
+    if stream:
+        return None
+    return sorted(results, key=lambda rec: rec.index)
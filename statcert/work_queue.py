@@ -0,0 +1,143 @@
+import itertools
+import pickle
+import sqlite3
+import time
+
+from .model import Record
+
+
+class WorkQueue:
+    """Queue of input chunks shared through a SQLite database, for scans
+    split between several machines.
+
+    A coordinator fills the queue, and workers lease one chunk at a time,
+    storing its serialized records once they're done. A chunk whose lease
+    expires before it's done, because its worker died or lost access to
+    the queue, is handed to the next worker asking for one.
+    """
+
+    def __init__(self, file, lease_time=300):
+        self.file = file
+        self.lease_time = lease_time
+        self.db = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def open(self):
+        # autocommit, so leases can use explicit immediate transactions
+        self.db = sqlite3.connect(self.file, timeout=60, isolation_level=None)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id INTEGER PRIMARY KEY,"
+            " inputs BLOB NOT NULL,"
+            " owner TEXT,"
+            " lease_expiry REAL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " results BLOB"
+            ")"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS meta ("
+            " key TEXT PRIMARY KEY,"
+            " value"
+            ")"
+        )
+
+    def close(self):
+        if self.db:
+            self.db.close()
+            self.db = None
+
+    @property
+    def filled(self):
+        row = self.db.execute(
+            "SELECT value FROM meta WHERE key = 'filled'"
+        ).fetchone()
+        return bool(row and row[0])
+
+    def fill(self, inputs, chunk_size=1000):
+        """Split `inputs` into chunks of `chunk_size` records, and queue
+        them. Workers may start leasing them before it's finished."""
+        inputs = iter(inputs)
+        while True:
+            chunk = list(itertools.islice(inputs, chunk_size))
+            if not chunk:
+                break
+            self.db.execute(
+                "INSERT INTO chunks (inputs) VALUES (?)",
+                (pickle.dumps(chunk),),
+            )
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES ('filled', 1)")
+
+    def lease(self, owner):
+        """Lease the first chunk that's neither done nor leased by a live
+        worker. Returns its id and inputs, or None if there isn't one."""
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute(
+                "SELECT id, inputs FROM chunks WHERE results IS NULL"
+                " AND (lease_expiry IS NULL OR lease_expiry < ?)"
+                " ORDER BY id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is not None:
+                self.db.execute(
+                    "UPDATE chunks SET owner = ?, lease_expiry = ?,"
+                    " attempts = attempts + 1 WHERE id = ?",
+                    (owner, now + self.lease_time, row[0]),
+                )
+        finally:
+            self.db.execute("COMMIT")
+
+        if row is None:
+            return None
+        chunk_id, inputs = row
+        return chunk_id, pickle.loads(inputs)
+
+    def renew(self, chunk_id, owner):
+        """Extend the lease on a chunk. Returns False if it was lost to
+        another worker."""
+        cursor = self.db.execute(
+            "UPDATE chunks SET lease_expiry = ?"
+            " WHERE id = ? AND owner = ? AND results IS NULL",
+            (time.time() + self.lease_time, chunk_id, owner),
+        )
+        return cursor.rowcount > 0
+
+    def complete(self, chunk_id, records):
+        """Store the finished records of a chunk. Only the first worker to
+        complete a chunk has its records kept."""
+        self.db.execute(
+            "UPDATE chunks SET results = ?, lease_expiry = NULL"
+            " WHERE id = ? AND results IS NULL",
+            (pickle.dumps([rec.serialize() for rec in records]), chunk_id),
+        )
+
+    def finished(self):
+        """Whether every chunk has been queued and done."""
+        if not self.filled:
+            return False
+        row = self.db.execute(
+            "SELECT COUNT(*) FROM chunks WHERE results IS NULL"
+        ).fetchone()
+        return row[0] == 0
+
+    def results(self, after=0):
+        """Yield the id and records of each done chunk past `after`, in
+        order, up to the first one that isn't done yet."""
+        rows = self.db.execute(
+            "SELECT id, results FROM chunks WHERE id > ? ORDER BY id",
+            (after,),
+        )
+        for chunk_id, results in rows:
+            if results is None:
+                return
+            yield chunk_id, [
+                Record.deserialize(data) for data in pickle.loads(results)
+            ]
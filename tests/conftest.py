@@ -1,6 +1,9 @@
 import asyncio
 import platform
 import pytest
+from aiohttp import web
+
+from .pki import OCSPResponder
 
 
 def pytest_addoption(parser):
@@ -36,3 +39,32 @@ def pytest_collection_modifyitems(config, items):
             for item in items
             if "web" in item.keywords
         ]
+
+
+@pytest.fixture
+async def ocsp_responder():
+    responder = OCSPResponder()
+    runner = web.AppRunner(responder.app())
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    responder.url = f"http://127.0.0.1:{port}"
+
+    yield responder
+
+    await runner.cleanup()
+
+
+@pytest.fixture
+async def silent_server():
+    """Accepts connections, but never answers."""
+    connections = []
+
+    async def handle(reader, writer):
+        connections.append(writer)
+        await reader.read()
+
+    server = await asyncio.start_server(handle, "localhost", 0)
+    async with server:
+        yield server.sockets[0].getsockname()[1], connections
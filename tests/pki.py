@@ -0,0 +1,221 @@
+"""Throwaway PKI and OCSP responder for offline tests."""
+import base64
+import datetime
+
+from aiohttp import web
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.hashes import SHA1, SHA256
+
+from statcert.operation.ocsp import HASH_ALGORITHM_IDS, _der
+from cryptography.x509 import ocsp
+from cryptography.x509.oid import AuthorityInformationAccessOID, NameOID
+
+
+def make_key():
+    return ec.generate_private_key(ec.SECP256R1())
+
+
+def make_cert(
+    subject, issuer, key, issuer_key,
+    is_ca=False, ocsp_url=None, issuer_url=None, sans=None,
+):
+    now = datetime.datetime.utcnow()
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(x509.Name([
+            x509.NameAttribute(NameOID.COMMON_NAME, subject)
+        ]))
+        .issuer_name(x509.Name([
+            x509.NameAttribute(NameOID.COMMON_NAME, issuer)
+        ]))
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(
+            x509.BasicConstraints(ca=is_ca, path_length=None),
+            critical=True,
+        )
+    )
+    if sans is None and not is_ca:
+        sans = [x509.DNSName(subject)]
+    if sans:
+        builder = builder.add_extension(
+            x509.SubjectAlternativeName(sans),
+            critical=False,
+        )
+    if ocsp_url or issuer_url:
+        builder = builder.add_extension(
+            x509.AuthorityInformationAccess([
+                x509.AccessDescription(
+                    AuthorityInformationAccessOID.OCSP,
+                    x509.UniformResourceIdentifier(ocsp_url),
+                ),
+                x509.AccessDescription(
+                    AuthorityInformationAccessOID.CA_ISSUERS,
+                    x509.UniformResourceIdentifier(issuer_url),
+                ),
+            ]),
+            critical=False,
+        )
+    return builder.sign(issuer_key, hashes.SHA256())
+
+
+class OCSPResponder:
+    """aiohttp app serving an issuer certificate at /ca.der and OCSP
+    responses at /ocsp, counting every request it receives."""
+
+    def __init__(self):
+        self.ca_key = make_key()
+        self.ca = make_cert("Test CA", "Test CA", self.ca_key, self.ca_key,
+                            is_ca=True)
+        self.certs = {}         # serial -> (cert, status)
+        self.requests = []      # (method, path)
+        self.queried = []       # serials in each OCSP request
+        self.rejected_hashes = set()
+        self.batch_support = True   # True | False | "first-only"
+        self.next_update = datetime.timedelta(hours=1)
+        self.url = None
+
+    def issue(self, domain, status=ocsp.OCSPCertStatus.GOOD):
+        cert = make_cert(
+            domain, "Test CA", make_key(), self.ca_key,
+            ocsp_url=f"{self.url}/ocsp",
+            issuer_url=f"{self.url}/ca.der",
+        )
+        self.certs[cert.serial_number] = (cert, status)
+        return cert
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/ca.der", self.get_issuer)
+        app.router.add_get("/ocsp/{req:.*}", self.get_ocsp)
+        app.router.add_post("/ocsp", self.post_ocsp)
+        return app
+
+    async def get_issuer(self, request):
+        self.requests.append(("GET", request.path))
+        return web.Response(
+            body=self.ca.public_bytes(serialization.Encoding.DER)
+        )
+
+    async def get_ocsp(self, request):
+        self.requests.append(("GET", request.path))
+        raw = base64.b64decode(request.match_info["req"])
+        return self.respond(raw)
+
+    async def post_ocsp(self, request):
+        self.requests.append(("POST", request.path))
+        return self.respond(await request.read())
+
+    def respond(self, raw):
+        algorithm, serials = _parse_ocsp_request(raw)
+        self.queried.append(serials)
+        if algorithm.name in self.rejected_hashes or (
+            len(serials) > 1 and not self.batch_support
+        ):
+            body = ocsp.OCSPResponseBuilder.build_unsuccessful(
+                ocsp.OCSPResponseStatus.MALFORMED_REQUEST
+            ).public_bytes(serialization.Encoding.DER)
+        elif len(serials) > 1 and self.batch_support == "first-only":
+            body = self.sign(serials[0], algorithm).public_bytes(
+                serialization.Encoding.DER
+            )
+        else:
+            body = self.sign_many(serials, algorithm)
+        return web.Response(
+            body=body,
+            content_type="application/ocsp-response",
+        )
+
+    def sign_many(self, serials, algorithm):
+        """DER-encoded response about all of `serials` (cryptography
+        only builds single certificate responses)."""
+        singles = [
+            _split_response(self.sign(serial, algorithm))
+            for serial in serials
+        ]
+        status, oid, tbs_fields, sig_alg, _, certs = singles[0]
+
+        list_idx = [tag for tag, _, _ in tbs_fields].index(0x30)
+        responses = b"".join(single[2][list_idx][1] for single in singles)
+        tbs = _der(0x30, b"".join(
+            _der(0x30, responses) if idx == list_idx else raw
+            for idx, (_, _, raw) in enumerate(tbs_fields)
+        ))
+        signature = self.ca_key.sign(tbs, ec.ECDSA(hashes.SHA256()))
+
+        basic = _der(0x30, b"".join([
+            tbs, sig_alg, _der(0x03, b"\x00" + signature), *certs,
+        ]))
+        return _der(0x30, status + _der(
+            0xa0, _der(0x30, oid + _der(0x04, basic))
+        ))
+
+    def sign(self, serial, algorithm):
+        cert, status = self.certs[serial]
+        now = datetime.datetime.utcnow()
+        revoked = status == ocsp.OCSPCertStatus.REVOKED
+        builder = ocsp.OCSPResponseBuilder().add_response(
+            cert=cert,
+            issuer=self.ca,
+            algorithm=algorithm,
+            cert_status=status,
+            this_update=now,
+            next_update=(
+                now + self.next_update if self.next_update else None
+            ),
+            revocation_time=now if revoked else None,
+            revocation_reason=None,
+        ).responder_id(ocsp.OCSPResponderEncoding.HASH, self.ca)
+        return builder.sign(self.ca_key, hashes.SHA256())
+
+
+def _tlvs(data):
+    """Split concatenated DER elements into (tag, content, raw)."""
+    elements = []
+    pos = 0
+    while pos < len(data):
+        tag, length, header = data[pos], data[pos+1], 2
+        if length & 0x80:
+            size = length & 0x7f
+            length = int.from_bytes(data[pos+2:pos+2+size], "big")
+            header += size
+        end = pos + header + length
+        elements.append((tag, data[pos+header:end], data[pos:end]))
+        pos = end
+    return elements
+
+
+def _parse_ocsp_request(raw):
+    [(_, ocsp_req, _)] = _tlvs(raw)
+    [(_, tbs, _), *_] = _tlvs(ocsp_req)
+    [request_list] = [
+        content for tag, content, _ in _tlvs(tbs) if tag == 0x30
+    ]
+
+    algorithm = None
+    serials = []
+    for _, request, _ in _tlvs(request_list):
+        [(_, cert_id, _), *_] = _tlvs(request)
+        alg_id, _, _, serial = _tlvs(cert_id)
+        algorithm = (
+            SHA1() if alg_id[2] == HASH_ALGORITHM_IDS["sha1"] else SHA256()
+        )
+        serials.append(int.from_bytes(serial[1], "big"))
+    return algorithm, serials
+
+
+def _split_response(resp):
+    raw = resp.public_bytes(serialization.Encoding.DER)
+    [(_, ocsp_resp, _)] = _tlvs(raw)
+    (_, _, status), (_, response_bytes, _) = _tlvs(ocsp_resp)
+    [(_, response_bytes, _)] = _tlvs(response_bytes)
+    (_, _, oid), (_, basic, _) = _tlvs(response_bytes)
+    [(_, basic, _)] = _tlvs(basic)
+    (_, tbs, _), (_, _, sig_alg), sig, *certs = _tlvs(basic)
+    return (
+        status, oid, _tlvs(tbs), sig_alg, sig, [raw for _, _, raw in certs]
+    )
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from statcert import Certificate, ChainInfo, Record, run_operation
+from statcert.checkpoint import Checkpoint
+from statcert.task_loop import strategy_worker_pool
+from . import TEST_FILES
+from .test_task_loop import EchoOperation
+
+
+def _records(start, end):
+    return [Record(idx, f"domain-{idx}.com") for idx in range(start, end)]
+
+
+async def test_checkpoint_resume(tmp_path):
+    file = tmp_path/"scan.ckpt"
+
+    with Checkpoint(file) as checkpoint:
+        first = await run_operation(
+            [EchoOperation()], _records(1, 6), checkpoint=checkpoint
+        )
+    with open(file, "ab") as fh:
+        fh.write(b'{"index": 6, "dom')  # interrupted while saving a record
+
+    done = []
+
+    async def callback(rec):
+        done.append(vars(rec))
+
+    operation = EchoOperation()
+    with Checkpoint(file, resume=True) as checkpoint:
+        assert len(checkpoint.done) == 5
+        results = await run_operation(
+            [operation], _records(1, 11),
+            strategy=strategy_worker_pool(4),
+            callback=callback,
+            checkpoint=checkpoint,
+        )
+
+    assert [rec.index for rec in results] == list(range(1, 11))
+    assert sorted(rec["index"] for rec in done) == list(range(1, 11))
+    assert done[:5] == [vars(rec) for rec in first]
+    assert sorted(operation.executed) == list(range(6, 11))
+
+    with Checkpoint(file, resume=True) as checkpoint:
+        assert len(checkpoint.done) == 10
+        assert [vars(rec) for rec in checkpoint.restore()] == done
+
+
+async def test_checkpoint_overwrite(tmp_path):
+    file = tmp_path/"scan.ckpt"
+
+    with Checkpoint(file) as checkpoint:
+        await run_operation(
+            [EchoOperation()], _records(1, 4), checkpoint=checkpoint
+        )
+    # a checkpoint holding records isn't overwritten by accident
+    with pytest.raises(FileExistsError):
+        with Checkpoint(file):
+            pass
+    with Checkpoint(file, resume=True) as checkpoint:
+        assert len(checkpoint.done) == 3
+
+    with Checkpoint(file, overwrite=True) as checkpoint:
+        await run_operation(
+            [EchoOperation()], _records(4, 6), checkpoint=checkpoint
+        )
+    with Checkpoint(file, resume=True) as checkpoint:
+        assert [rec.index for rec in checkpoint.restore()] == [4, 5]
+
+
+def test_checkpoint_restores_types(tmp_path):
+    file = tmp_path/"scan.ckpt"
+    with open(TEST_FILES/"certs"/"google.der", "rb") as f:
+        cert = Certificate(f.read())
+    rec = Record(1, "google.com", rank=3).append(cert).append(
+        ChainInfo([cert])
+    )
+
+    with Checkpoint(file) as checkpoint:
+        checkpoint.save(rec)
+    with Checkpoint(file, resume=True) as checkpoint:
+        [restored] = checkpoint.restore()
+
+    assert vars(restored) == vars(rec)
+    # saved as plain JSON, not pickled
+    with open(file) as fh:
+        assert json.loads(fh.readline())["domain"] == "google.com"
@@ -1,7 +1,23 @@
+import base64
+import csv
+import ipaddress
+import itertools
+import json
+import sqlite3
+from datetime import datetime
+
 import pytest
+from cryptography import x509
 
 from . import TEST_FILES
+from .pki import make_cert, make_key
+from statcert import Certificate, ChainInfo, ProbeInfo, Record
+from statcert.model import OCSPInfo, TimingInfo
+from statcert.cli.inputs import get_domains_from_file
+from statcert.cli.main import get_inputs
 from statcert.cli.options import parse_options
+from statcert.cli.summary import Summary, create_summary
+from statcert.cli.outputs import CertificateWriter, IGNORE_FIELDS, open_output
 
 
 class TestInputOptions:
@@ -124,6 +140,66 @@ class TestInputOptions:
                 assert options.get(k) == v
 
 
+class TestInputs:
+    @pytest.mark.parametrize(
+        ["file", "xdomains"],
+        [
+            ("test.txt", [(1, "fujikyu.co.jp"), (2, "google.com")]),
+            ("test.csv", [(1, "google.com"), (2, "netflix.com")]),
+            ("top-5.csv", [(1, "google.com"), (2, "netflix.com")]),
+            ("rand-5.csv", [
+                (776279, "yaymicro.com"),
+                (121543, "conferencealerts.com"),
+            ]),
+        ],
+    )
+    def test_domains_from_file(self, file, xdomains):
+        with open(TEST_FILES/"inputs"/file) as fh:
+            records = get_domains_from_file(fh)
+            assert [
+                (rec["index"], rec["domain"])
+                for rec in itertools.islice(records, 2)
+            ] == xdomains
+
+    def test_domains_from_file_is_lazy(self):
+        def lines():
+            yield "1,google.com\n"
+            yield "2,netflix.com\n"
+            raise AssertionError("read past the requested records")
+
+        records = get_domains_from_file(lines())
+        assert next(records) == {"index": 1, "domain": "google.com"}
+
+    @pytest.mark.parametrize(
+        ["inp_range", "xindexes", "xtotal"],
+        [
+            ((0, None), [1, 2, 3, 4, 5], 5),
+            ((0, 2), [1, 2], 2),
+            ((2, 4), [3, 4], 2),
+            ((3, 10), [4, 5], 2),
+        ],
+    )
+    def test_get_inputs_range(self, inp_range, xindexes, xtotal):
+        domains = [f"domain-{idx}.com" for idx in range(1, 6)]
+        inputs, total = get_inputs(
+            domains, "domain", range=inp_range, log=lambda *_: None
+        )
+        assert [inp["index"] for inp in inputs] == xindexes
+        assert total == xtotal
+
+    def test_get_inputs_file_total(self):
+        file = str(TEST_FILES/"inputs"/"top-5.csv")
+        log = lambda *_: None
+
+        _, total = get_inputs([file], "file", log=log)
+        assert total is None
+        inputs, total = get_inputs([file], "file", range=(1, 3), log=log)
+        assert total == 2
+        assert [inp["domain"] for inp in inputs] == [
+            "netflix.com", "youtube.com",
+        ]
+
+
 class TestOutputOptions:
     @pytest.fixture(params=[
         (  # CSV
@@ -138,10 +214,25 @@ class TestOutputOptions:
             "-o file.txt",
             {"out_file": "file.txt", "out_format": "plain"}
         ),
+        (  # JSON Lines
+            "-o file.jsonl",
+            {"out_file": "file.jsonl", "out_format": "jsonl"}
+        ),
+        (  # Parquet
+            "-o file.parquet",
+            {"out_file": "file.parquet", "out_format": "parquet"}
+        ),
+        (  # SQLite
+            "-o file.sqlite",
+            {"out_file": "file.sqlite", "out_format": "sqlite"}
+        ),
     ], ids=[
         "file.csv",
         "file.json",
-        "file.txt"
+        "file.txt",
+        "file.jsonl",
+        "file.parquet",
+        "file.sqlite",
     ])
     def output_file(self, request):
         return request.param
@@ -190,11 +281,374 @@ class TestOutputOptions:
             for k, v in xopts.items():
                 assert options.get(k) == v
 
-    # @pytest.mark.parametrize(
-    #     ["record"]
-    # )
-    def test_write_output(self):
-        ...
+    def test_parse_opts_certs(self):
+        options = parse_options("statcert -o out.csv".split())
+        assert options.out_certs is None
+        options = parse_options("statcert -o out.csv --certs c.jsonl".split())
+        assert options.out_certs == "c.jsonl"
+
+
+
+def _sample_records():
+    with open(TEST_FILES/"certs"/"google.der", "rb") as f:
+        cert = Certificate(f.read())
+    return [
+        Record(1, "google.com").append(ProbeInfo(
+            status="valid",
+            home_page="https://www.google.com/",
+            redirected=True,
+            attempts=1,
+            errors=[],
+            reason=None,
+        )).append(cert),
+        Record(2, "unreachable.com").append(ProbeInfo(
+            status="unknown",
+            home_page=None,
+            redirected=None,
+            attempts=1,
+            errors=[{"type": "timeout"}],
+            reason="timeout",
+        )),
+    ]
+
+
+class TestOutputWriters:
+    @pytest.fixture
+    def records(self):
+        return _sample_records()
+
+    def _write(self, records, file, format, **kwargs):
+        with open_output(str(file), format, **kwargs) as out:
+            for rec in records:
+                out.write(rec)
+
+    def test_write_csv(self, records, tmp_path):
+        self._write(records[::-1], tmp_path/"out.csv", "csv")
+        with open(tmp_path/"out.csv", newline="") as fh:
+            rows = list(csv.DictReader(fh))
+
+        assert [row["domain"] for row in rows] == [
+            "unreachable.com", "google.com",
+        ]
+        assert rows[1]["cert_subject_name"] == "www.google.com"
+        assert rows[0]["cert_subject_name"] == ""
+        assert "cert_bytes" not in rows[0]
+
+    @pytest.mark.parametrize("format", ["json", "jsonl"])
+    def test_write_json(self, records, tmp_path, format):
+        self._write(records, tmp_path/"out", format)
+        with open(tmp_path/"out") as fh:
+            if format == "json":
+                data = json.load(fh)
+            else:
+                data = [json.loads(line) for line in fh]
+
+        assert [rec["domain"] for rec in data] == [
+            "google.com", "unreachable.com",
+        ]
+        assert data[0]["cert_not_after"] == "2022-04-04T03:35:31"
+        assert data[1]["probe_reason"] == "timeout"
+
+    def test_write_plain(self, records, tmp_path):
+        self._write(records, tmp_path/"out.txt", "plain")
+        text = (tmp_path/"out.txt").read_text()
+
+        assert text.startswith("#1 google.com")
+        assert "\n\n#2 unreachable.com" in text
+
+    def test_write_parquet(self, records, tmp_path):
+        parquet = pytest.importorskip("pyarrow.parquet")
+        records[1].user_info["rank"] = 7
+        self._write(records[::-1], tmp_path/"out.parquet", "parquet",
+                    row_group_size=1)
+
+        file = parquet.ParquetFile(tmp_path/"out.parquet")
+        rows = file.read().to_pylist()
+
+        assert file.num_row_groups == 2
+        assert [row["domain"] for row in rows] == [
+            "unreachable.com", "google.com",
+        ]
+        assert rows[0]["rank"] == "7"
+        assert rows[1]["cert_not_after"] == datetime(2022, 4, 4, 3, 35, 31)
+        assert rows[1]["cert_subject_alt_names"][0] == "www.google.com"
+        assert rows[1]["cert_subject"] == list(
+            records[0].results["cert"].subject.items()
+        )
+        assert json.loads(rows[0]["probe_errors"]) == [{"type": "timeout"}]
+        assert rows[0]["cert_bytes"] is None
+
+    @pytest.mark.parametrize(
+        "format", ["json", "jsonl", "parquet", "sqlite"]
+    )
+    def test_write_ip_sans(self, tmp_path, format):
+        key = make_key()
+        cert = Certificate(make_cert(
+            "example.com", "Test CA", key, key, sans=[
+                x509.DNSName("example.com"),
+                x509.IPAddress(ipaddress.ip_address("192.0.2.1")),
+                x509.IPAddress(ipaddress.ip_address("2001:db8::1")),
+            ],
+        ))
+        records = [Record(1, "192.0.2.1").append(cert)]
+        self._write(records, tmp_path/"out", format)
+
+        if format == "parquet":
+            parquet = pytest.importorskip("pyarrow.parquet")
+            table = parquet.read_table(tmp_path/"out")
+            sans = table.column("cert_subject_alt_names").to_pylist()[0]
+        elif format == "sqlite":
+            db = sqlite3.connect(tmp_path/"out")
+            sans, = db.execute(
+                "SELECT subject_alt_names FROM certificates"
+            ).fetchone()
+        else:
+            with open(tmp_path/"out") as fh:
+                data = json.loads(fh.read().strip("[]\n"))
+            sans = data["cert_subject_alt_names"]
+        if isinstance(sans, str):
+            sans = json.loads(sans)
+        assert sans == ["example.com", "192.0.2.1", "2001:db8::1"]
+
+    def test_write_sqlite(self, records, tmp_path):
+        cert = records[0].results["cert"]
+        with open(TEST_FILES/"certs"/"tubitak-intermediate.der", "rb") as f:
+            intermediate = Certificate(f.read())
+        records[1].user_info["rank"] = 7
+        records.append(Record(3, "google.net").append(cert).append(
+            ChainInfo([cert, intermediate])
+        ))
+        records[0].append(TimingInfo("timing", dns=0.5, total=2))
+        self._write(records, tmp_path/"out.sqlite", "sqlite")
+
+        db = sqlite3.connect(tmp_path/"out.sqlite")
+        assert db.execute(
+            "SELECT record_index, domain, user_info FROM records"
+            " ORDER BY record_index"
+        ).fetchall() == [
+            (1, "google.com", None),
+            (2, "unreachable.com", '{"rank": 7}'),
+            (3, "google.net", None),
+        ]
+        assert db.execute(
+            "SELECT fingerprint, subject_name, not_after, der"
+            " FROM certificates"
+            " ORDER BY not_after"
+        ).fetchall() == [
+            (
+                cert.fingerprint, "www.google.com", "2022-04-04T03:35:31",
+                bytes(cert),
+            ),
+            (
+                intermediate.fingerprint, intermediate.subject_name,
+                "2025-05-11T13:32:27", bytes(intermediate),
+            ),
+        ]
+        assert db.execute(
+            "SELECT domain FROM records JOIN probes USING (record_index)"
+            " WHERE status = 'valid'"
+        ).fetchall() == [("google.com",)]
+        assert db.execute("SELECT * FROM errors").fetchall() == [
+            (2, 0, "timeout", None, None),
+        ]
+        assert db.execute(
+            "SELECT fingerprint FROM chains WHERE record_index = 3"
+            " ORDER BY position"
+        ).fetchall() == [(cert.fingerprint,), (intermediate.fingerprint,)]
+        assert db.execute(
+            "SELECT subject_alt_names FROM certificates WHERE fingerprint = ?",
+            (intermediate.fingerprint,),
+        ).fetchall() == [("[]",)]
+        assert db.execute(
+            "SELECT * FROM timings ORDER BY phase"
+        ).fetchall() == [
+            (1, "probe", "dns", 0.5),
+            (1, "probe", "redirects", 0),
+            (1, "probe", "total", 2),
+        ]
+
+    def test_write_certs(self, records, tmp_path):
+        records.append(Record(3, "google.net").append(
+            records[0].results["cert"]
+        ))
+        self._write(
+            records, tmp_path/"out.jsonl", "jsonl", exclude=IGNORE_FIELDS
+        )
+        with CertificateWriter(str(tmp_path/"certs.jsonl")) as out:
+            for rec in records:
+                out.write(rec)
+
+        with open(tmp_path/"out.jsonl") as fh:
+            data = [json.loads(line) for line in fh]
+        with open(tmp_path/"certs.jsonl") as fh:
+            [cert] = [json.loads(line) for line in fh]
+
+        assert "cert_bytes" not in data[0]
+        assert data[0]["cert_fingerprint"] == data[2]["cert_fingerprint"]
+        assert cert["fingerprint"] == data[0]["cert_fingerprint"]
+        assert base64.b64decode(cert["bytes"]) == bytes(
+            records[0].results["cert"]
+        )
+
+    def test_writer_flushes(self, records, tmp_path):
+        with open_output(str(tmp_path/"out"), "jsonl", flush_every=2) as out:
+            out.write(records[0])
+            assert (tmp_path/"out").read_text() == ""
+            out.write(records[1])
+            assert len((tmp_path/"out").read_text().splitlines()) == 2
+
+
+class TestSummary:
+    def test_summary_incremental(self):
+        records = _sample_records()
+        records[0].append(OCSPInfo("good"))
+        records.append(Record.deserialize(records[0].serialize()))
+
+        summary = Summary()
+        for rec in records:
+            summary.add(rec)
+
+        assert summary.as_dict() == create_summary(
+            [vars(rec) for rec in records]
+        )
+        assert summary.as_dict()["ocsp"] == {"good": 2}
+        assert summary.postfix() == {"https": 2, "errors": 1}
+
+
+class TestOCSPOptions:
+    @pytest.mark.parametrize(
+        ["opt_str", "xopts"],
+        [
+            ("", {
+                "inp_ocsp": False,
+                "inp_ocsp_cache": None,
+                "inp_ocsp_batch": 1,
+            }),
+            ("--ocsp --ocsp-cache ocsp.sqlite --ocsp-batch 20", {
+                "inp_ocsp": True,
+                "inp_ocsp_cache": "ocsp.sqlite",
+                "inp_ocsp_batch": 20,
+            }),
+        ],
+        ids=["default", "all"],
+    )
+    def test_parse_opts_ocsp(self, opt_str, xopts):
+        options = parse_options(("statcert "+opt_str).split())
+        for k, v in xopts.items():
+            assert options.get(k) == v
+
+
+class TestRunOptions:
+    @pytest.mark.parametrize(
+        ["opt_str", "xopts"],
+        [
+            ("", {
+                "run_concurrency": 100,
+                "run_workers": 1,
+                "run_probe": "http",
+                "run_rate": None,
+                "run_host_rate": None,
+                "run_role": None,
+                "run_nameservers": None,
+                "run_retry_delay": 0.25,
+                "run_retry_budget": 0.2,
+                "run_timeout": 2,
+                "run_slow_timeout": 60,
+                "run_two_pass": False,
+                "run_connection_limit": None,
+                "run_keepalive": 15,
+                "run_dns_ttl": None,
+            }),
+            ("-c 1", {"run_concurrency": 1}),
+            ("--concurrency 5_000", {"run_concurrency": 5000}),
+            ("-w 4", {"run_workers": 4}),
+            ("--probe tls", {"run_probe": "tls"}),
+            ("--checkpoint scan.ckpt --resume", {
+                "run_checkpoint": "scan.ckpt",
+                "run_resume": True,
+                "run_overwrite_checkpoint": False,
+            }),
+            ("--rate 500 --host-rate 2.5", {
+                "run_rate": 500,
+                "run_host_rate": 2.5,
+            }),
+            ("--metrics-port 9100", {"run_metrics_port": 9100}),
+            ("--coordinate scan.queue", {
+                "run_role": "coordinator",
+                "run_queue": "scan.queue",
+            }),
+            ("--work scan.queue", {
+                "run_role": "worker",
+                "run_queue": "scan.queue",
+            }),
+            ("--nameservers 1.1.1.1,2606:4700:4700::1111", {
+                "run_nameservers": ["1.1.1.1", "2606:4700:4700::1111"],
+            }),
+            ("--retry-delay 1 --retry-budget 0.5", {
+                "run_retry_delay": 1,
+                "run_retry_budget": 0.5,
+            }),
+            (
+                "--connection-limit 200 --host-connection-limit 8"
+                " --keepalive 0 --happy-eyeballs 0.25 --dns-ttl 300",
+                {
+                    "run_connection_limit": 200,
+                    "run_host_connection_limit": 8,
+                    "run_keepalive": 0,
+                    "run_happy_eyeballs": 0.25,
+                    "run_dns_ttl": 300,
+                },
+            ),
+            ("--two-pass --timeout 1 --slow-timeout 30 --slow-concurrency 5", {
+                "run_timeout": 1,
+                "run_slow_timeout": 30,
+                "run_two_pass": True,
+                "run_slow_concurrency": 5,
+            }),
+        ],
+        ids=[
+            "default",
+            "sequential",
+            "concurrent",
+            "workers",
+            "tls probe",
+            "resume",
+            "rate limits",
+            "metrics",
+            "coordinator",
+            "worker",
+            "nameservers",
+            "retries",
+            "connections",
+            "two pass",
+        ],
+    )
+    def test_parse_opts_run(self, opt_str, xopts):
+        options = parse_options(("statcert "+opt_str).split())
+        for k, v in xopts.items():
+            assert options.get(k) == v
+
+    @pytest.mark.parametrize(
+        ["opt_str", "xraises"],
+        [
+            ("-c 0", SystemExit),
+            ("--workers 0", SystemExit),
+            ("--rate 0", SystemExit),
+            ("--host-rate -1", SystemExit),
+            ("--resume", ValueError),
+            ("--overwrite-checkpoint", ValueError),
+            ("--coordinate a.queue --work b.queue", SystemExit),
+            ("--work scan.queue -w 2", ValueError),
+            ("--nameservers dns.google", SystemExit),
+            ("--retry-delay 0", SystemExit),
+            ("--slow-concurrency 0", SystemExit),
+            ("--keepalive -1", SystemExit),
+        ],
+    )
+    def test_parse_opts_run_invalid(self, opt_str, xraises):
+        pytest.raises(
+            xraises, parse_options, ("statcert "+opt_str).split()
+        )
 
 
 class TestLoggingOptions:
@@ -0,0 +1,134 @@
+import asyncio
+import ssl
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+
+from statcert import CertHandshake, Certificate, Record, run_operation
+from statcert.retry import RetryPolicy
+from .pki import make_cert, make_key
+
+
+@pytest.fixture
+def tls_files(tmp_path):
+    ca_key = make_key()
+    ca = make_cert("Test CA", "Test CA", ca_key, ca_key, is_ca=True)
+    key = make_key()
+    leaf = make_cert("localhost", "Test CA", key, ca_key)
+
+    pem = serialization.Encoding.PEM
+    (tmp_path/"ca.pem").write_bytes(ca.public_bytes(pem))
+    (tmp_path/"chain.pem").write_bytes(
+        leaf.public_bytes(pem) + ca.public_bytes(pem)
+    )
+    (tmp_path/"key.pem").write_bytes(key.private_bytes(
+        pem,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ))
+    return tmp_path, leaf, ca
+
+
+@pytest.fixture
+async def tls_server(tls_files):
+    path, leaf, ca = tls_files
+    requests = []
+
+    async def handle(reader, writer):
+        try:
+            requests.append(await reader.read())
+        except ConnectionError:
+            requests.append(b"")
+        writer.close()
+
+    server_ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_ctx.load_cert_chain(path/"chain.pem", path/"key.pem")
+    server = await asyncio.start_server(
+        handle, "localhost", 0, ssl=server_ctx
+    )
+    port = server.sockets[0].getsockname()[1]
+
+    async with server:
+        yield port, path/"ca.pem", leaf, ca, requests
+
+
+async def test_handshake_fetches_chain(tls_server):
+    port, ca_file, leaf, ca, requests = tls_server
+    operation = CertHandshake(
+        port=port,
+        ssl_context=ssl.create_default_context(cafile=str(ca_file)),
+    )
+
+    rec, again = await run_operation(
+        [operation], [Record(1, "localhost"), Record(2, "localhost")]
+    )
+
+    assert rec.results["probe"].status == "valid"
+    assert rec.results["probe"].attempts == 1
+    assert rec.results["cert"] == Certificate(leaf)
+    assert rec.results["chain"].certificates[0] == Certificate(leaf)
+    if rec.results["chain"].certificates[1:]:  # Python >= 3.10
+        assert rec.results["chain"].certificates[1] == Certificate(ca)
+    # both records share the same parsed certificate
+    assert again.results["cert"] is rec.results["cert"]
+    await asyncio.sleep(0.05)
+    assert requests == [b"", b""]
+
+
+async def test_handshake_invalid_certificate(tls_server):
+    port, *_ = tls_server
+    operation = CertHandshake(port=port)
+
+    [rec] = await run_operation([operation], [Record(1, "localhost")])
+
+    assert rec.results["probe"].status == "unknown"
+    assert rec.results["probe"].reason == "invalid certificate"
+    assert rec.results["probe"].attempts == 1
+    assert "cert" not in rec.results
+
+
+async def test_handshake_connection_error(unused_tcp_port):
+    operation = CertHandshake(port=unused_tcp_port, max_attempts=2)
+
+    [rec] = await run_operation([operation], [Record(1, "localhost")])
+
+    assert rec.results["probe"].status == "unknown"
+    assert rec.results["probe"].reason == "connection error"
+    assert rec.results["probe"].attempts == 2
+
+
+async def test_handshake_unknown_error():
+    # a label longer than 63 characters can't be encoded with IDNA
+    domain = "a" * 64 + ".com"
+
+    [rec] = await run_operation([CertHandshake()], [Record(1, domain)])
+
+    assert rec.results["probe"].status == "unknown"
+    assert rec.results["probe"].reason == "unknown error"
+    assert rec.results["probe"].attempts == 1
+    assert "UnicodeError" in rec.results["probe"].errors[0]["class"]
+
+
+@pytest.mark.parametrize("deferred", [False, True])
+async def test_handshake_timeout_escalates(silent_server, deferred):
+    port, connections = silent_server
+    operation = CertHandshake(
+        port=port,
+        default_timeout=0.05,
+        lenient_timeout=0.2,
+        retry_policy=RetryPolicy(
+            base_delay=0.01,
+            deferred_errors=["timeout"] if deferred else [],
+        ),
+    )
+
+    start = time.monotonic()
+    [rec] = await run_operation([operation], [Record(1, "localhost")])
+
+    assert rec.results["probe"].status == "unknown"
+    assert rec.results["probe"].reason == "timeout"
+    # the timeout budget allows a single retry, with the lenient timeout
+    assert rec.results["probe"].attempts == 2
+    assert time.monotonic() - start >= 0.25
+    assert len(connections) == 2
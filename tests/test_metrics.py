@@ -0,0 +1,67 @@
+import aiohttp
+
+from statcert import Record, run_operation, strategy_worker_pool
+from statcert.metrics import MetricsRegistry, serve_metrics
+from statcert.operation import CertHandshake
+from .test_task_loop import EchoOperation
+
+
+def test_metrics_render():
+    metrics = MetricsRegistry()
+    metrics.counter("errors_total", "Errors").inc(type='say "hi"')
+    metrics.gauge("in_flight").set(3)
+    latency = metrics.histogram("latency_seconds", buckets=[0.1, 1])
+    for value in [0.05, 0.1, 0.5, 2]:
+        latency.observe(value)
+
+    assert metrics.render().splitlines() == [
+        "# HELP errors_total Errors",
+        "# TYPE errors_total counter",
+        'errors_total{type="say \\"hi\\""} 1',
+        "# HELP in_flight ",
+        "# TYPE in_flight gauge",
+        "in_flight 3",
+        "# HELP latency_seconds ",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 2.65",
+        "latency_seconds_count 4",
+    ]
+
+
+async def test_run_operation_metrics(unused_tcp_port):
+    metrics = MetricsRegistry()
+    records = [Record(idx, f"domain-{idx}.com") for idx in range(1, 21)]
+
+    await run_operation(
+        [EchoOperation()], records,
+        strategy=strategy_worker_pool(4), metrics=metrics,
+    )
+    await run_operation(
+        [CertHandshake(port=unused_tcp_port, max_attempts=2)],
+        [Record(1, "localhost")], metrics=metrics,
+    )
+
+    runner = await serve_metrics(metrics, unused_tcp_port)
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(
+                f"http://127.0.0.1:{unused_tcp_port}/metrics"
+            ) as resp:
+                text = await resp.text()
+    finally:
+        await runner.cleanup()
+
+    lines = text.splitlines()
+    assert "statcert_records_total 21" in lines
+    assert "statcert_records_in_flight 0" in lines
+    assert (
+        'statcert_operation_seconds_count{operation="EchoOperation"} 20'
+        in lines
+    )
+    assert (
+        'statcert_probe_errors_total{type="connection error"} 2' in lines
+    )
+    assert "statcert_probe_retries_total 1" in lines
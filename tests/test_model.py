@@ -3,8 +3,10 @@ from datetime import datetime
 
 import pytest
 
-from statcert import Certificate
+from statcert import Certificate, CertificateStore, ChainInfo, ProbeInfo
+from statcert.model import TimingInfo
 from . import TEST_FILES
+from .pki import make_cert, make_key
 
 
 @pytest.fixture(
@@ -99,3 +101,65 @@ def test_model_attributes(cert_info):
     assert cert_info["serial"] == cert.serial_number
     assert cert_info["key"] == cert.key_type
     assert cert_info["type"] == cert.policy_type
+
+
+def test_model_memoized(cert_info):
+    cert = cert_info["cert"]
+
+    assert cert.subject is cert.subject
+    assert cert.subject_alt_names is cert.subject_alt_names
+    assert vars(cert) == vars(cert)
+    assert vars(cert) is not vars(cert)
+
+
+def test_model_slots(cert_info):
+    infos = [
+        cert_info["cert"],
+        ProbeInfo("valid", None, False, 1, [], None),
+        ChainInfo([cert_info["cert"]]),
+        TimingInfo("timing", dns=0.5),
+    ]
+
+    for info in infos:
+        with pytest.raises(AttributeError):
+            info.extra = None
+
+
+def test_model_fingerprint(cert_info):
+    cert = cert_info["cert"]
+    same = Certificate(cert.as_bytes("pem").decode("ascii"))
+
+    assert cert.der == same.der == bytes(cert)
+    assert len(cert.fingerprint) == 64
+    assert cert == same and hash(cert) == hash(same)
+    assert len({cert, same, Certificate(cert.cert)}) == 1
+
+
+def test_model_ca_certificate():
+    # a real intermediate, without subject alternative names
+    with open(TEST_FILES/"certs"/"tubitak-intermediate.der", "rb") as f:
+        cert = Certificate(f.read())
+
+    assert cert.subject_alt_names == []
+    assert cert.issuer_name.startswith("Turkiye Bilimsel")
+    assert vars(cert)["subject_alt_names"] == []
+
+    # issuers named only by their common name
+    key = make_key()
+    cert = Certificate(make_cert("Test CA", "Test CA", key, key, is_ca=True))
+    assert cert.issuer_name == cert.subject_name == "Test CA"
+
+
+def test_certificate_store(cert_info):
+    store = CertificateStore()
+    der = bytes(cert_info["cert"])
+
+    cert = store.get_or_create(der)
+    assert store.get_or_create(bytes(der)) is cert
+    assert cert.fingerprint in store
+    assert (store.hits, store.misses) == (1, 1)
+
+    # only kept while referenced
+    del cert
+    assert len(store) == 0
+
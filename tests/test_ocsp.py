@@ -0,0 +1,292 @@
+import asyncio
+import time
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives.hashes import SHA1, SHA256
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.x509.ocsp import OCSPCertStatus
+
+from statcert import Certificate, CheckOCSP, Record, run_operation
+from statcert.metrics import MetricsRegistry
+from statcert.operation.cache import AsyncLRUCache, OCSPResponseCache
+from statcert.operation.ocsp import _build_batch_ocsp_req
+from statcert.task_loop import strategy_worker_pool
+from .pki import _parse_ocsp_request
+
+
+def _records(responder, statuses):
+    records = []
+    for idx, status in enumerate(statuses, start=1):
+        cert = responder.issue(f"domain-{idx}.com", status)
+        records.append(Record(idx, f"domain-{idx}.com").append(
+            Certificate(cert)
+        ))
+    return records
+
+
+async def test_check_ocsp_status(ocsp_responder):
+    records = _records(ocsp_responder, [
+        OCSPCertStatus.GOOD,
+        OCSPCertStatus.REVOKED,
+        OCSPCertStatus.UNKNOWN,
+    ])
+
+    results = await run_operation([CheckOCSP()], records)
+
+    assert [rec.results["ocsp"].status for rec in results] == [
+        "good", "revoked", "unknown",
+    ]
+
+
+async def test_check_ocsp_timing(ocsp_responder):
+    records = _records(ocsp_responder, [OCSPCertStatus.GOOD] * 2)
+    metrics = MetricsRegistry()
+
+    results = await run_operation([CheckOCSP()], records, metrics=metrics)
+
+    for rec in results:
+        timing = vars(rec.results["ocsp_timing"])
+        assert list(timing) == [
+            "dns", "connect", "http", "issuer", "throttle", "batch",
+            "total", "redirects",
+        ]
+        assert timing["http"] > 0
+        assert timing["total"] >= timing["issuer"] + timing["http"]
+        assert timing["redirects"] == 0
+    # the issuer is only fetched for the first record
+    first, second = (vars(rec.results["ocsp_timing"]) for rec in results)
+    assert first["issuer"] > second["issuer"]
+    assert (
+        'statcert_phase_seconds_count{operation="CheckOCSP",phase="http"} 2'
+        in metrics.render()
+    )
+
+
+async def test_check_ocsp_fetches_issuer_once(ocsp_responder):
+    records = _records(ocsp_responder, [OCSPCertStatus.GOOD] * 20)
+
+    results = await run_operation(
+        [CheckOCSP()], records, strategy=strategy_worker_pool(10)
+    )
+
+    assert all(rec.results["ocsp"].status == "good" for rec in results)
+    assert ocsp_responder.requests.count(("GET", "/ca.der")) == 1
+
+
+class TestAsyncLRUCache:
+    async def test_coalesces_concurrent_fetches(self):
+        cache = AsyncLRUCache()
+        calls = []
+
+        async def fetch():
+            calls.append(None)
+            await asyncio.sleep(0.01)
+            return "value"
+
+        values = await asyncio.gather(
+            *(cache.get("key", fetch) for _ in range(10))
+        )
+
+        assert values == ["value"] * 10
+        assert len(calls) == 1
+        assert await cache.get("key", fetch) == "value"
+        assert len(calls) == 1
+
+    async def test_evicts_least_recently_used(self):
+        cache = AsyncLRUCache(maxsize=2)
+
+        async def fetch():
+            return None
+
+        await cache.get("a", fetch)
+        await cache.get("b", fetch)
+        await cache.get("a", fetch)
+        await cache.get("c", fetch)
+
+        assert list(cache.entries) == ["a", "c"]
+
+    async def test_failures_are_not_cached(self):
+        cache = AsyncLRUCache()
+
+        async def fail():
+            raise ValueError("unreachable")
+
+        async def fetch():
+            return "value"
+
+        with pytest.raises(ValueError):
+            await cache.get("key", fail)
+        assert "key" not in cache
+        assert await cache.get("key", fetch) == "value"
+
+
+async def test_check_ocsp_response_cache(ocsp_responder, tmp_path):
+    records = _records(ocsp_responder, [
+        OCSPCertStatus.GOOD,
+        OCSPCertStatus.REVOKED,
+    ])
+    cache_file = tmp_path/"ocsp.sqlite"
+
+    def ocsp_requests():
+        return [req for req in ocsp_responder.requests if "ocsp" in req[1]]
+
+    for _ in range(2):
+        results = await run_operation(
+            [CheckOCSP(response_cache_file=cache_file)],
+            [Record(rec.index, rec.domain).append(rec.results["cert"])
+             for rec in records],
+        )
+        assert [rec.results["ocsp"].status for rec in results] == [
+            "good", "revoked",
+        ]
+        assert len(ocsp_requests()) == 2
+
+
+async def test_check_ocsp_response_cache_expiry(ocsp_responder, tmp_path):
+    ocsp_responder.next_update = None
+    records = _records(ocsp_responder, [OCSPCertStatus.GOOD])
+    cache_file = tmp_path/"ocsp.sqlite"
+
+    for _ in range(2):
+        await run_operation(
+            [CheckOCSP(response_cache_file=cache_file)],
+            [Record(1, "domain-1.com").append(records[0].results["cert"])],
+        )
+
+    with OCSPResponseCache(cache_file) as cache:
+        assert cache.db.execute(
+            "SELECT COUNT(*) FROM ocsp_responses"
+        ).fetchone() == (0,)
+    assert len([
+        req for req in ocsp_responder.requests if "ocsp" in req[1]
+    ]) == 2
+
+
+def test_ocsp_response_cache_freshness(tmp_path):
+    now = time.time()
+    with OCSPResponseCache(tmp_path/"ocsp.sqlite") as cache:
+        cache.put(("aa", "1"), b"fresh", now - 10, now + 10)
+        cache.put(("aa", "2"), b"expired", now - 20, now - 10)
+        cache.put(("aa", "3"), b"future", now + 10, now + 20)
+
+        assert cache.get(("aa", "1")) == b"fresh"
+        assert cache.get(("aa", "2")) is None
+        assert cache.get(("aa", "3")) is None
+        assert cache.get(("bb", "1")) is None
+
+        cache.purge()
+        assert cache.db.execute(
+            "SELECT COUNT(*) FROM ocsp_responses"
+        ).fetchone() == (2,)
+
+
+def test_ocsp_response_cache_shared(tmp_path):
+    now = time.time()
+    with OCSPResponseCache(tmp_path/"ocsp.sqlite") as first, \
+            OCSPResponseCache(tmp_path/"ocsp.sqlite") as second:
+        for serial in range(10):
+            # neither holds a write lock after storing a response
+            first.put(("aa", str(serial)), b"first", now - 10, now + 10)
+            second.put(("bb", str(serial)), b"second", now - 10, now + 10)
+
+        assert first.get(("bb", "9")) == b"second"
+        assert second.get(("aa", "9")) == b"first"
+
+
+def test_batch_request_encoding(ocsp_responder):
+    ocsp_responder.url = "http://127.0.0.1"
+    certs = [ocsp_responder.issue(f"domain-{idx}.com") for idx in range(3)]
+
+    for hash in [SHA1, SHA256]:
+        single = x509.ocsp.OCSPRequestBuilder().add_certificate(
+            certs[0], ocsp_responder.ca, hash()
+        ).build()
+        assert _build_batch_ocsp_req(
+            certs[:1], ocsp_responder.ca, hash
+        ) == single.public_bytes(Encoding.DER)
+
+    algorithm, serials = _parse_ocsp_request(
+        _build_batch_ocsp_req(certs, ocsp_responder.ca, SHA1)
+    )
+    assert algorithm.name == "sha1"
+    assert serials == [cert.serial_number for cert in certs]
+
+
+@pytest.mark.parametrize(
+    ["batch_support", "xbatched", "xposts"],
+    [(True, 10, 2), (False, 0, 4), ("first-only", 2, 2)],
+    ids=["supported", "unsupported", "first only"],
+)
+async def test_check_ocsp_batches(
+    ocsp_responder, batch_support, xbatched, xposts
+):
+    ocsp_responder.batch_support = batch_support
+    statuses = [OCSPCertStatus.GOOD, OCSPCertStatus.REVOKED] * 5
+    records = _records(ocsp_responder, statuses)
+    operation = CheckOCSP(batch_size=5)
+
+    results = await run_operation(
+        [operation], records, strategy=strategy_worker_pool(10)
+    )
+
+    assert [rec.results["ocsp"].status for rec in results] == [
+        "good", "revoked",
+    ] * 5
+    posts = ocsp_responder.requests.count(("POST", "/ocsp"))
+    gets = len([
+        req for req in ocsp_responder.requests
+        if req[0] == "GET" and "ocsp" in req[1]
+    ])
+    # rejected batches are retried with another hash
+    assert posts == xposts
+    assert gets == 10 - xbatched
+    assert (batch_support is True) == (
+        f"{ocsp_responder.url}/ocsp" not in operation.batch_unsupported
+    )
+
+
+async def test_check_ocsp_batch_hash_fallback(ocsp_responder):
+    ocsp_responder.rejected_hashes = {"sha1"}
+    records = _records(ocsp_responder, [OCSPCertStatus.GOOD] * 5)
+    operation = CheckOCSP(batch_size=5)
+
+    results = await run_operation(
+        [operation], records, strategy=strategy_worker_pool(10)
+    )
+
+    assert all(rec.results["ocsp"].status == "good" for rec in results)
+    ocsp_url = f"{ocsp_responder.url}/ocsp"
+    assert ocsp_responder.requests.count(("POST", "/ocsp")) == 2
+    assert ("GET", "/ocsp") not in {
+        (method, path[:5]) for method, path in ocsp_responder.requests
+    }
+    assert ocsp_url not in operation.batch_unsupported
+    assert operation.responder_hashes == {ocsp_url: "sha256"}
+
+
+async def test_check_ocsp_learns_responder_hash(ocsp_responder, tmp_path):
+    ocsp_responder.rejected_hashes = {"sha1"}
+    cache_file = tmp_path/"ocsp.sqlite"
+
+    def ocsp_gets():
+        return len([
+            req for req in ocsp_responder.requests
+            if req[0] == "GET" and "ocsp" in req[1]
+        ])
+
+    records = _records(ocsp_responder, [OCSPCertStatus.GOOD] * 5)
+    operation = CheckOCSP(response_cache_file=cache_file)
+    results = await run_operation([operation], records)
+
+    assert all(rec.results["ocsp"].status == "good" for rec in results)
+    assert ocsp_gets() == 6
+    assert operation.responder_hashes == {
+        f"{ocsp_responder.url}/ocsp": "sha256"
+    }
+
+    # a new scan remembers the hash from the cache file
+    records = _records(ocsp_responder, [OCSPCertStatus.GOOD] * 5)
+    await run_operation([CheckOCSP(response_cache_file=cache_file)], records)
+
+    assert ocsp_gets() == 11
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from statcert.rate_limit import RateLimiter, TokenBucket
+
+
+async def _timed(coros):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    await asyncio.gather(*coros)
+    return loop.time() - start
+
+
+async def test_token_bucket_rate():
+    bucket = TokenBucket(rate=200, burst=1)
+    elapsed = await _timed(bucket.acquire() for _ in range(21))
+    assert elapsed >= 0.09
+
+
+async def test_token_bucket_burst():
+    bucket = TokenBucket(rate=1, burst=10)
+    elapsed = await _timed(bucket.acquire() for _ in range(10))
+    assert elapsed < 0.05
+
+
+def test_token_bucket_invalid_rate():
+    pytest.raises(ValueError, TokenBucket, 0)
+
+
+async def test_host_rate_is_per_destination():
+    limiter = RateLimiter(host_rate=10, host_burst=1)
+    elapsed = await _timed(
+        limiter.acquire(f"host-{idx}.com") for idx in range(20)
+    )
+    assert elapsed < 0.05
+    assert len(limiter.host_buckets) == 20
+
+    elapsed = await _timed(limiter.acquire("host-0.com") for _ in range(2))
+    assert elapsed >= 0.1
+
+
+async def test_global_rate():
+    limiter = RateLimiter(rate=200, host_rate=1000)
+    limiter.global_bucket.burst = limiter.global_bucket.tokens = 1
+    elapsed = await _timed(
+        limiter.acquire(f"host-{idx}.com") for idx in range(21)
+    )
+    assert elapsed >= 0.09
+
+
+async def test_idle_host_buckets_are_pruned():
+    limiter = RateLimiter(host_rate=1000)
+    limiter.PRUNE_INTERVAL = 10
+    for idx in range(9):
+        await limiter.acquire(f"host-{idx}.com")
+    await asyncio.sleep(0.01)
+    await limiter.acquire("host-9.com")
+    assert list(limiter.host_buckets) == ["host-9.com"]
@@ -0,0 +1,112 @@
+import asyncio
+import socket
+
+import pytest
+
+from statcert import CertAiohttp, CertHandshake, Record, run_operation
+from statcert.operation.resolver import CachingResolver, DNSCache, HostNotFound
+from statcert.rate_limit import RateLimiter
+
+
+class FakeLookup:
+    def __init__(self, hosts, ttl=60, delay=0):
+        self.hosts = hosts  # name -> address, or None if it doesn't exist
+        self.ttl = ttl
+        self.delay = delay
+        self.queries = []
+
+    async def lookup(self, host, family):
+        self.queries.append(host)
+        await asyncio.sleep(self.delay)
+        address = self.hosts.get(host)
+        if address is None:
+            raise HostNotFound(f"{host}: not found")
+        return [(socket.AF_INET, address)], self.ttl
+
+
+async def test_resolver_caches_answers():
+    lookup = FakeLookup({"a.com": "127.0.0.2"}, delay=0.01)
+    resolver = CachingResolver(lookup, DNSCache())
+
+    results = await asyncio.gather(*(
+        resolver.resolve("a.com", 443) for _ in range(10)
+    ))
+    results.append(await resolver.resolve("a.com", 80))
+
+    assert lookup.queries == ["a.com"]
+    assert [res[0]["host"] for res in results] == ["127.0.0.2"] * 11
+    assert results[0][0]["port"] == 443
+    assert results[-1][0]["port"] == 80
+
+
+async def test_resolver_respects_ttl():
+    lookup = FakeLookup({"a.com": "127.0.0.2"}, ttl=0.05)
+    resolver = CachingResolver(lookup, DNSCache())
+
+    await resolver.resolve("a.com")
+    await resolver.resolve("a.com")
+    await asyncio.sleep(0.1)
+    await resolver.resolve("a.com")
+
+    assert lookup.queries == ["a.com", "a.com"]
+
+
+async def test_resolver_negative_cache():
+    lookup = FakeLookup({})
+    resolver = CachingResolver(lookup, DNSCache(negative_ttl=60))
+
+    for _ in range(3):
+        with pytest.raises(HostNotFound):
+            await resolver.resolve("dead.com")
+
+    assert lookup.queries == ["dead.com"]
+
+
+async def test_resolver_errors_not_cached():
+    class FlakyLookup(FakeLookup):
+        async def lookup(self, host, family):
+            if not self.queries:
+                self.queries.append(host)
+                raise OSError("timeout")
+            return await super().lookup(host, family)
+
+    lookup = FlakyLookup({"a.com": "127.0.0.2"})
+    resolver = CachingResolver(lookup, DNSCache())
+
+    with pytest.raises(OSError):
+        await resolver.resolve("a.com")
+    assert (await resolver.resolve("a.com"))[0]["host"] == "127.0.0.2"
+
+
+@pytest.mark.parametrize("operation", [CertAiohttp, CertHandshake])
+async def test_probe_gives_up_on_missing_host(operation):
+    lookup = FakeLookup({})
+    resolver = CachingResolver(lookup, DNSCache())
+
+    [rec] = await run_operation(
+        [operation(resolver=resolver)], [Record(1, "dead.com")]
+    )
+
+    probe = rec.results["probe"]
+    assert probe.status == "unknown"
+    assert probe.reason == "host not found"
+    assert len(probe.errors) == 1
+    assert lookup.queries == ["dead.com"]
+
+
+@pytest.mark.parametrize("operation", [CertAiohttp, CertHandshake])
+async def test_probe_host_rate_per_address(operation):
+    # nothing listens on these addresses, so each probe fails right away
+    lookup = FakeLookup({"a.com": "127.0.0.2", "b.com": "127.0.0.2"})
+    resolver = CachingResolver(lookup, DNSCache())
+    limiter = RateLimiter(host_rate=1000)
+
+    await run_operation(
+        [operation(resolver=resolver, max_attempts=1)],
+        [Record(1, "a.com"), Record(2, "b.com"), Record(3, "dead.com")],
+        limiter=limiter,
+    )
+
+    # domains on the same address share its limit
+    assert list(limiter.host_buckets) == ["127.0.0.2", "dead.com"]
+    assert sorted(lookup.queries) == ["a.com", "b.com", "dead.com"]
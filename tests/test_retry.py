@@ -0,0 +1,169 @@
+import time
+
+import pytest
+from aiohttp import web
+
+from statcert import CertAiohttp, Record, run_operation
+from statcert.retry import RetryBudget, RetryPolicy
+
+
+def test_retry_backoff():
+    policy = RetryPolicy(base_delay=1, max_delay=5, jitter=False)
+
+    assert [policy.delay(failures) for failures in range(1, 6)] == [
+        1, 2, 4, 5, 5,
+    ]
+    policy.jitter = True
+    assert all(0 <= policy.delay(3) <= 4 for _ in range(100))
+
+
+def test_retry_error_budgets():
+    policy = RetryPolicy(budgets={"timeout": 2}, jitter=False)
+    state = policy.start(timeout=2)
+
+    assert policy.retry_delay(state, "connection error", True) == 0.25
+    assert policy.retry_delay(state, "timeout", True) == 0.5
+    assert policy.retry_delay(state, "timeout", True) is None
+    assert policy.retry_delay(state, "invalid certificate", False) is None
+    assert state.failures == {
+        "connection error": 1, "timeout": 2, "invalid certificate": 1,
+    }
+
+
+def test_retry_budget():
+    policy = RetryPolicy(retry_budget=RetryBudget(ratio=0.5, min_retries=1))
+    states = [policy.start(timeout=2) for _ in range(4)]
+
+    allowed = [
+        policy.retry_delay(state, "connection error", True) is not None
+        for state in states
+    ]
+
+    # 1 + 4 * 0.5 retries
+    assert allowed == [True, True, True, False]
+
+
+@pytest.mark.parametrize(
+    ["error", "delay", "xdefers"],
+    [
+        ("connection error", 1, False),
+        ("connection error", 5, True),
+        ("timeout", 0.1, True),
+    ],
+)
+def test_retry_defers(error, delay, xdefers):
+    policy = RetryPolicy(defer_after=5, deferred_errors=["timeout"])
+
+    assert policy.defers(error, delay) == xdefers
+
+
+async def test_aiohttp_probe_retries():
+    # nothing listens on localhost:443 nor :80
+    operation = CertAiohttp(retry_policy=RetryPolicy(base_delay=0.01))
+
+    [rec] = await run_operation([operation], [Record(1, "localhost")])
+
+    probe = rec.results["probe"]
+    assert probe.status == "unknown"
+    assert probe.reason == "connection error"
+    # two attempts over HTTPS, as allowed for connection errors, then one
+    # over plain HTTP once they're used up
+    assert probe.attempts == 3
+    assert [":443" in error["message"] for error in probe.errors] == [
+        True, True, False,
+    ]
+    assert ":80" in probe.errors[-1]["message"]
+
+
+async def test_aiohttp_probe_http_only():
+    async def hello(request):
+        return web.Response(text="hello")
+
+    app = web.Application()
+    app.router.add_get("/", hello)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "localhost", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    operation = CertAiohttp(retry_policy=RetryPolicy(base_delay=0.01))
+
+    try:
+        [rec] = await run_operation(
+            [operation], [Record(1, f"localhost:{port}")]
+        )
+    finally:
+        await runner.cleanup()
+
+    probe = rec.results["probe"]
+    assert (probe.status, probe.reason) == ("missing", "no https support")
+    assert probe.home_page == f"http://localhost:{port}"
+    assert "cert" not in rec.results
+
+
+async def test_aiohttp_probe_retry_budget_exhausted():
+    budget = RetryBudget(min_retries=0)
+    operation = CertAiohttp(retry_policy=RetryPolicy(retry_budget=budget))
+    budget.balance = -10  # spent by other records
+
+    [rec] = await run_operation([operation], [Record(1, "localhost")])
+
+    probe = rec.results["probe"]
+    assert (probe.status, probe.reason) == ("unknown", "connection error")
+    # no HTTPS retry, only the plain HTTP attempt
+    assert probe.attempts == 2
+    assert ":80" in probe.errors[-1]["message"]
+
+
+def test_retry_deferred_errors():
+    budget = RetryBudget(min_retries=0)
+    policy = RetryPolicy(retry_budget=budget, deferred_errors=["timeout"])
+    state = policy.start(timeout=2)
+
+    # deferred once, even with the retry budget used up
+    assert policy.retry_delay(state, "timeout", True) == 0
+    assert policy.defers("timeout", 0)
+    state.defer(0)
+    assert policy.retry_delay(state, "timeout", True) is None
+
+
+async def test_aiohttp_probe_two_pass_timeouts(silent_server):
+    port, connections = silent_server
+    budget = RetryBudget(min_retries=0)
+    operation = CertAiohttp(
+        default_timeout=0.05,
+        lenient_timeout=0.5,
+        retry_policy=RetryPolicy(
+            retry_budget=budget, deferred_errors=["timeout"],
+        ),
+    )
+    budget.balance = -10  # spent by other records
+
+    start = time.monotonic()
+    [rec] = await run_operation(
+        [operation], [Record(1, f"localhost:{port}")]
+    )
+
+    probe = rec.results["probe"]
+    assert (probe.status, probe.reason) == ("unknown", "timeout")
+    # deferred with the default timeout, retried once with the lenient
+    # one, then over plain HTTP with the default one again
+    assert probe.attempts == 3
+    assert len(connections) == 3
+    elapsed = time.monotonic() - start
+    assert 0.5 + 2 * 0.05 <= elapsed < 2 * 0.5
+    assert all(error["type"] == "timeout" for error in probe.errors)
+
+
+def test_retry_defaults_defer():
+    policy = RetryPolicy(jitter=False)
+    state = policy.start(timeout=2)
+
+    delays = [
+        policy.retry_delay(state, error, True)
+        for error in ["connection error", "TLS error", "timeout"]
+    ]
+
+    assert [policy.defers("timeout", delay) for delay in delays] == [
+        False, False, True,
+    ]
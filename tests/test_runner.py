@@ -0,0 +1,121 @@
+import sqlite3
+
+from statcert.checkpoint import Checkpoint
+from statcert.cli.options import parse_options
+from statcert.cli.runner import (
+    build_limiter,
+    build_operations,
+    build_retry_strategy,
+    run_sharded,
+)
+from statcert.operation.resolver import SHARED_CACHE
+
+
+def _inputs(start, end):
+    # nothing listens on localhost:443, so each probe fails right away
+    return ({"index": idx, "domain": "localhost"} for idx in range(start, end))
+
+
+async def test_run_sharded_order():
+    options = parse_options("statcert --probe tls -c 8 localhost".split())
+    done = []
+
+    async def callback(rec):
+        done.append(rec.index)
+
+    results = await run_sharded(options, _inputs(1, 201), 3, callback=callback)
+
+    assert done == list(range(1, 201))
+    assert [rec.index for rec in results] == done
+    assert all(vars(rec)["probe_status"] for rec in results)
+
+
+async def test_run_sharded_resume(tmp_path):
+    options = parse_options("statcert --probe tls localhost".split())
+    file = tmp_path/"scan.ckpt"
+
+    with Checkpoint(file) as checkpoint:
+        await run_sharded(options, _inputs(1, 6), 2, checkpoint=checkpoint)
+    with Checkpoint(file, resume=True) as checkpoint:
+        assert len(checkpoint.done) == 5
+        results = await run_sharded(
+            options, _inputs(1, 11), 2, checkpoint=checkpoint
+        )
+
+    assert [rec.index for rec in results] == list(range(1, 11))
+
+
+async def test_run_sharded_ocsp_cache(tmp_path):
+    cache_file = tmp_path/"ocsp.sqlite"
+    options = parse_options(
+        f"statcert --probe tls --ocsp --ocsp-cache {cache_file} localhost"
+        .split()
+    )
+
+    # both workers open the same cache
+    results = await run_sharded(options, _inputs(1, 21), 2)
+
+    assert [rec.index for rec in results] == list(range(1, 21))
+    with sqlite3.connect(cache_file) as db:
+        assert db.execute(
+            "SELECT COUNT(*) FROM ocsp_responses"
+        ).fetchone() == (0,)
+
+
+def test_build_limiter_shares():
+    options = parse_options(
+        "statcert --rate 100 --host-rate 4 localhost".split()
+    )
+    limiter = build_limiter(options, shares=4)
+
+    assert limiter.global_bucket.rate == 25
+    assert limiter.host_rate == 1
+    assert build_limiter(parse_options("statcert localhost".split())) is None
+
+
+def test_build_two_pass():
+    options = parse_options(
+        "statcert --two-pass --timeout 1 --slow-timeout 20 localhost".split()
+    )
+    [probe] = build_operations(options)
+
+    assert probe.default_timeout == 1
+    assert probe.lenient_timeout == 20
+    assert probe.retry_policy.deferred_errors == {"timeout"}
+    assert build_retry_strategy(options) is not None
+
+    options = parse_options("statcert localhost".split())
+    assert not build_operations(options)[0].retry_policy.deferred_errors
+    assert build_retry_strategy(options) is None
+
+
+def test_build_resolver_shares_cache(monkeypatch):
+    monkeypatch.setattr(SHARED_CACHE, "max_ttl", SHARED_CACHE.max_ttl)
+    options = parse_options("statcert --dns-ttl 30 localhost".split())
+
+    first = build_operations(options)[0].resolver
+    second = build_operations(options)[0].resolver
+
+    assert first.cache is second.cache is SHARED_CACHE
+    assert SHARED_CACHE.max_ttl == 30
+
+
+async def test_build_connector_settings():
+    options = parse_options(
+        "statcert -c 500 --ocsp --keepalive 0 --host-connection-limit 4"
+        " localhost".split()
+    )
+    probe, ocsp = build_operations(options)
+    settings = probe.connector_settings
+    connector = settings.connector()
+
+    assert ocsp.connector_settings is settings
+    assert connector.limit == 500
+    assert connector.limit_per_host == 4
+    assert connector.force_close
+    assert connector._ssl is settings.get_ssl_context()
+    await connector.close()
+
+    options = parse_options("statcert --probe tls --ocsp localhost".split())
+    probe, ocsp = build_operations(options)
+    assert probe.ssl_context is ocsp.connector_settings.get_ssl_context()
@@ -0,0 +1,221 @@
+import asyncio
+import random
+from dataclasses import dataclass
+
+import pytest
+
+from statcert import (
+    Info,
+    Record,
+    run_operation,
+    strategy_naive_sequential,
+    strategy_worker_pool,
+)
+from statcert.model import Operation
+from statcert.retry import DeferredRetry, RetryState
+
+
+@dataclass
+class EchoInfo(Info):
+    op_name = "echo"
+
+    domain: str
+
+    @property
+    def __dict__(self):
+        return {"domain": self.domain}
+
+
+class EchoOperation(Operation):
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.executed = []
+
+    @staticmethod
+    def prepare_entry(record):
+        return {"domain": record.domain}
+
+    async def execute(self, domain):
+        self.executed.append(int(domain.split("-")[1].split(".")[0]))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(random.random() / 100)
+        self.in_flight -= 1
+        return [EchoInfo(domain)]
+
+
+@pytest.fixture
+def records():
+    return [Record(idx, f"domain-{idx}.com") for idx in range(1, 51)]
+
+
+@pytest.mark.parametrize(
+    "strategy",
+    [
+        strategy_naive_sequential,
+        strategy_worker_pool(1),
+        strategy_worker_pool(8),
+        strategy_worker_pool(100),
+    ],
+    ids=["sequential", "pool-1", "pool-8", "pool-100"],
+)
+async def test_run_operation_order(records, strategy):
+    done = []
+
+    async def callback(rec):
+        done.append(rec.index)
+
+    results = await run_operation(
+        [EchoOperation()], records, strategy=strategy, callback=callback
+    )
+
+    assert [rec.index for rec in results] == list(range(1, 51))
+    assert all(
+        rec.results["echo"].domain == rec.domain for rec in results
+    )
+    assert sorted(done) == list(range(1, 51))
+
+
+async def test_worker_pool_bounds_concurrency(records):
+    operation = EchoOperation()
+
+    await run_operation(
+        [operation], records, strategy=strategy_worker_pool(8)
+    )
+
+    assert 1 < operation.max_in_flight <= 8
+
+
+@pytest.mark.parametrize(
+    "strategy",
+    [strategy_naive_sequential, strategy_worker_pool(8)],
+    ids=["sequential", "pool-8"],
+)
+async def test_run_operation_stream(records, strategy):
+    done = []
+    kept = []
+
+    async def callback(rec):
+        done.append(rec)
+
+    async def keeping_strategy(coroutines):
+        kept.extend(await strategy(coroutines))
+        return kept
+
+    results = await run_operation(
+        [FlakyOperation(), EchoOperation()], records,
+        strategy=keeping_strategy, callback=callback, stream=True,
+    )
+
+    assert results is None
+    assert kept == []
+    assert sorted(rec.index for rec in done) == list(range(1, 51))
+    assert all(rec.results["echo"].domain == rec.domain for rec in done)
+
+
+@pytest.mark.parametrize(
+    "strategy",
+    [strategy_naive_sequential, strategy_worker_pool(8)],
+    ids=["sequential", "pool-8"],
+)
+async def test_run_operation_async_records(records, strategy):
+    ticks = []
+
+    async def received():
+        for rec in records:
+            # records arriving slowly leave the loop free meanwhile
+            await asyncio.sleep(0.001)
+            yield rec
+
+    async def ticker():
+        while True:
+            ticks.append(None)
+            await asyncio.sleep(0)
+
+    ticking = asyncio.ensure_future(ticker())
+    try:
+        results = await run_operation(
+            [EchoOperation()], received(), strategy=strategy
+        )
+    finally:
+        ticking.cancel()
+
+    assert [rec.index for rec in results] == list(range(1, 51))
+    assert len(ticks) > 50
+
+
+def test_worker_pool_invalid_size():
+    pytest.raises(ValueError, strategy_worker_pool, 0)
+
+
+@dataclass
+class AttemptsInfo(Info):
+    op_name = "flaky"
+
+    attempts: int
+
+    @property
+    def __dict__(self):
+        return {"attempts": self.attempts}
+
+
+class FlakyOperation(EchoOperation):
+    """Defers the first attempt at every third record."""
+
+    async def execute(self, domain, retry_state=None):
+        idx = int(domain.split("-")[1].split(".")[0])
+        if idx % 3 == 0 and retry_state is None:
+            state = RetryState(timeout=1)
+            state.attempts = 1
+            raise DeferredRetry(state)
+        await super().execute(domain)
+        return [AttemptsInfo(retry_state.attempts + 1 if retry_state else 1)]
+
+
+@pytest.mark.parametrize(
+    "strategy",
+    [strategy_naive_sequential, strategy_worker_pool(8)],
+    ids=["sequential", "pool-8"],
+)
+async def test_run_operation_deferred_retries(records, strategy):
+    done = []
+
+    async def callback(rec):
+        done.append(rec.index)
+
+    results = await run_operation(
+        [FlakyOperation(), EchoOperation()], records,
+        strategy=strategy, callback=callback,
+    )
+
+    deferred = [idx for idx in range(1, 51) if idx % 3 == 0]
+    assert [rec.index for rec in results] == list(range(1, 51))
+    assert all(
+        rec.results["echo"].domain == rec.domain for rec in results
+    )
+    assert {
+        rec.index: rec.results["flaky"].attempts for rec in results
+    } == {idx: 2 if idx in deferred else 1 for idx in range(1, 51)}
+    # deferred records are only done once the others are
+    assert sorted(done[-len(deferred):]) == deferred
+
+
+async def test_run_operation_retry_strategy(records):
+    passes = []
+
+    def counted(strategy, name):
+        async def counted_strategy(coroutines):
+            coroutines = list(coroutines)
+            passes.append((name, len(coroutines)))
+            return await strategy(coroutines)
+        return counted_strategy
+
+    results = await run_operation(
+        [FlakyOperation()], records,
+        strategy=counted(strategy_worker_pool(8), "fast"),
+        retry_strategy=counted(strategy_naive_sequential, "slow"),
+    )
+
+    assert passes == [("fast", 50), ("slow", 16)]
+    assert all("flaky" in rec.results for rec in results)
@@ -0,0 +1,66 @@
+import asyncio
+
+from statcert import Record
+from statcert.cli.options import parse_options
+from statcert.cli.runner import run_coordinator, run_worker
+from statcert.work_queue import WorkQueue
+
+
+def _inputs(start, end):
+    # nothing listens on localhost:443, so each probe fails right away
+    return ({"index": idx, "domain": "localhost"} for idx in range(start, end))
+
+
+def test_lease_expiry(tmp_path):
+    with WorkQueue(tmp_path/"scan.queue") as work_queue:
+        work_queue.fill(_inputs(1, 9), chunk_size=4)
+        assert work_queue.filled
+
+        first, inputs = work_queue.lease("a")
+        assert [inp["index"] for inp in inputs] == [1, 2, 3, 4]
+        second, _ = work_queue.lease("b")
+        assert second != first
+        assert work_queue.lease("c") is None
+
+        # a dead worker's chunk goes to the next one asking
+        work_queue.db.execute(
+            "UPDATE chunks SET lease_expiry = 0 WHERE id = ?", (first,)
+        )
+        assert work_queue.lease("c")[0] == first
+        assert not work_queue.renew(first, "a")
+        assert work_queue.renew(first, "c")
+
+        work_queue.complete(first, [Record(**inp) for inp in inputs])
+        work_queue.complete(first, [])
+        [(chunk_id, records)] = work_queue.results()
+        assert chunk_id == first
+        assert [rec.index for rec in records] == [1, 2, 3, 4]
+        assert not work_queue.finished()
+
+
+async def test_coordinator_and_workers(tmp_path):
+    options = parse_options("statcert --probe tls -c 4 localhost".split())
+    file = tmp_path/"scan.queue"
+    done = []
+
+    async def callback(rec):
+        done.append(rec.index)
+
+    with WorkQueue(file) as coordinator_queue, \
+            WorkQueue(file) as queue_a, WorkQueue(file) as queue_b:
+        # a chunk leased by a worker that died
+        coordinator_queue.fill(_inputs(1, 31), chunk_size=7)
+        queue_a.lease("dead")
+        queue_a.db.execute("UPDATE chunks SET lease_expiry = 0")
+
+        results, *_ = await asyncio.gather(
+            run_coordinator(
+                coordinator_queue, _inputs(1, 31),
+                callback=callback, poll_interval=0.1,
+            ),
+            run_worker(options, queue_a, owner="a", poll_interval=0.1),
+            run_worker(options, queue_b, owner="b", poll_interval=0.1),
+        )
+
+    assert done == list(range(1, 31))
+    assert [rec.index for rec in results] == done